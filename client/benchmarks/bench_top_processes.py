@@ -0,0 +1,83 @@
+"""Benchmark top-N process collection on a host with many processes.
+
+Compares the original approach (process_iter over every process, a dict per
+process, a full sort, keep 20) with the client's get_top_processes, which
+keeps psutil handles between samples and selects the top N with a heap.
+Optionally spawns idle `sleep` processes first to simulate a busy host.
+
+Usage:
+    python benchmarks/bench_top_processes.py [--spawn 2000] [--rounds 10]
+"""
+import argparse
+import contextlib
+import io
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import psutil
+
+# Importing the client creates its token file, so do it from a scratch directory
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+os.chdir(tempfile.mkdtemp())
+with contextlib.redirect_stdout(io.StringIO()):
+    import client
+
+def full_sort_top_processes():
+    """The original implementation: build every process dict, sort, slice"""
+    processes = []
+    for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'create_time']):
+        try:
+            pinfo = proc.info
+            if pinfo['cpu_percent'] is not None:
+                processes.append({
+                    'pid': pinfo['pid'],
+                    'name': pinfo['name'] or 'Unknown',
+                    'cpu_percent': pinfo['cpu_percent'],
+                    'memory_percent': round(pinfo['memory_percent'] or 0, 2),
+                    'create_time': pinfo['create_time']
+                })
+        except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+            pass
+    processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
+    return processes[:client.TOP_PROCESSES]
+
+def time_rounds(collect, rounds, interval):
+    """Median wall time of `rounds` collections spaced `interval` seconds apart"""
+    collect()  # Warm-up round that establishes CPU baselines
+    timings = []
+    for _ in range(rounds):
+        time.sleep(interval)
+        started = time.perf_counter()
+        result = collect()
+        timings.append(time.perf_counter() - started)
+    timings.sort()
+    return timings[len(timings) // 2] * 1000, len(result)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--spawn', type=int, default=0, help='idle processes to start before measuring')
+    parser.add_argument('--rounds', type=int, default=10, help='timed collections per approach')
+    parser.add_argument('--interval', type=float, default=0.5, help='seconds between collections')
+    args = parser.parse_args()
+    
+    children = []
+    try:
+        for _ in range(args.spawn):
+            children.append(subprocess.Popen(['sleep', '600']))
+        
+        print(f"processes on host: {len(psutil.pids())}, top N: {client.TOP_PROCESSES}, "
+              f"sort: {client.TOP_PROCESSES_SORT}")
+        
+        for label, collect in (('full sort', full_sort_top_processes), ('heap + handles', client.get_top_processes)):
+            median_ms, returned = time_rounds(collect, args.rounds, args.interval)
+            print(f"  {label:<16} {median_ms:>8.1f} ms/sample  {returned:>3} processes returned")
+    finally:
+        for child in children:
+            child.kill()
+            child.wait()
+
+if __name__ == '__main__':
+    main()
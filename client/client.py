@@ -1,4 +1,5 @@
-from fastapi import FastAPI, Request, HTTPException
+from fastapi import FastAPI, Request, HTTPException, Response
+from fastapi.middleware.gzip import GZipMiddleware
 from contextlib import asynccontextmanager
 import psutil
 import uuid
@@ -6,11 +7,74 @@ import platform
 import os
 import time
 import threading
+import heapq
+import json
+import gzip
+import urllib.request
+import urllib.error
 
-# Global variables for network tracking
-previous_net_io = None
-previous_time = None
-network_usage_lock = threading.Lock()
+try:
+    import msgpack
+except ImportError:  # The binary wire format is optional; JSON is always available
+    msgpack = None
+
+MSGPACK_TYPE = "application/x-msgpack"
+
+# Background sampling settings
+SAMPLE_INTERVAL = 5  # Seconds between system snapshots taken by the sampler
+TOP_PROCESSES = int(os.environ.get("STATS_TOP_PROCESSES", 20))  # Processes included in each snapshot
+TOP_PROCESSES_SORT = os.environ.get("STATS_TOP_PROCESSES_SORT", "cpu")  # "cpu", "memory" or "io"
+HISTORY_SIZE = 720  # Snapshots kept for /systeminfo/since (one hour at 5 s)
+
+# psutil handles kept between samples so per-process CPU and IO are real deltas
+process_handles = {}
+previous_process_io = {}
+
+# Push mode: set STATS_PUSH_URL (e.g. http://server:8001/api/ingest) to report to
+# the dashboard server instead of waiting to be polled
+PUSH_URL = os.environ.get("STATS_PUSH_URL", "")
+PUSH_INTERVAL = 30  # Seconds between pushes unless the server asks for another pace
+PUSH_BATCH_SIZE = 120  # Most snapshots sent in one push
+PUSH_TIMEOUT = 10  # Seconds to wait for the server to answer a push
+
+# Identifies this run of the client; sequence numbers restart when it changes
+BOOT_ID = str(uuid.uuid4())
+
+# Labelled series sent with every snapshot under "metrics" as [name, labels, value];
+# the server stores the names listed in its METRIC_DESCRIPTORS
+METRICS_ENABLED = os.environ.get("STATS_METRICS", "1") != "0"
+
+class SnapshotRing:
+    """Fixed-size ring buffer of snapshots numbered with increasing sequence numbers"""
+    
+    def __init__(self, size):
+        self.size = size
+        self.slots = [None] * size
+        self.next_seq = 1
+        self.lock = threading.Lock()
+    
+    def append(self, snapshot):
+        """Store a snapshot, overwriting the oldest one when the buffer is full"""
+        with self.lock:
+            snapshot["seq"] = self.next_seq
+            self.slots[self.next_seq % self.size] = snapshot
+            self.next_seq += 1
+    
+    def latest(self):
+        """Get the newest snapshot, or None before the first one"""
+        with self.lock:
+            return self.slots[(self.next_seq - 1) % self.size]
+    
+    def since(self, seq):
+        """Get the snapshots newer than seq that are still buffered, oldest first"""
+        with self.lock:
+            start = max(seq + 1, self.next_seq - self.size, 1)
+            return [self.slots[n % self.size] for n in range(start, self.next_seq)]
+
+# Snapshots taken by the sampler thread, served as-is by the /systeminfo endpoints
+history = SnapshotRing(HISTORY_SIZE)
+snapshot_ready = threading.Event()
+sampler_stop = threading.Event()
 
 # Function to get or create a persistent token
 def get_persistent_token():
@@ -33,85 +97,305 @@ print(f"Token: {TOKEN}")
 print(f"Add this computer to the dashboard using the above token")
 print(f"======================")
 
-@asynccontextmanager
-async def lifespan(app: FastAPI):
-    # Startup
-    print(f"FastAPI client started. Token: {TOKEN}")
-    yield
-    # Shutdown (if needed)
-
-app = FastAPI(lifespan=lifespan)
-
-# Middleware to check token
-@app.middleware("http")
-async def verify_token(request: Request, call_next):
-    auth = request.headers.get("Authorization")
-    if auth != f"Bearer {TOKEN}":
-        raise HTTPException(status_code=401, detail="Unauthorized")
-    return await call_next(request)
-
-@app.get("/systeminfo")
-def get_system_info():
-    global previous_net_io, previous_time
-    
-    # Get disk usage - try different paths for Windows/Linux
-    disk_path = "C:\\" if platform.system() == "Windows" else "/"
-    
-    # Get current network stats
-    current_net_io = psutil.net_io_counters()
-    current_time = time.time()
+def process_sort_value(proc, pid):
+    """Measure the TOP_PROCESSES_SORT key of a process since the previous sample"""
+    if TOP_PROCESSES_SORT == "memory":
+        return proc.memory_percent()
     
-    network_usage_rate = {"bytes_sent_per_sec": 0, "bytes_recv_per_sec": 0}
+    if TOP_PROCESSES_SORT == "io":
+        try:
+            io = proc.io_counters()
+        except (psutil.AccessDenied, AttributeError):
+            return 0
+        total = io.read_bytes + io.write_bytes
+        previous = previous_process_io.get(pid)
+        previous_process_io[pid] = total
+        return total - previous if previous is not None else 0
     
-    with network_usage_lock:
-        if previous_net_io is not None and previous_time is not None:
-            time_diff = current_time - previous_time
-            if time_diff > 0:
-                bytes_sent_diff = current_net_io.bytes_sent - previous_net_io.bytes_sent
-                bytes_recv_diff = current_net_io.bytes_recv - previous_net_io.bytes_recv
+    return proc.cpu_percent(interval=None)
+
+def get_top_processes():
+    """Get the TOP_PROCESSES busiest processes by TOP_PROCESSES_SORT"""
+    try:
+        pids = set(psutil.pids())
+        
+        # Forget processes that exited since the previous sample
+        for pid in [pid for pid in process_handles if pid not in pids]:
+            del process_handles[pid]
+            previous_process_io.pop(pid, None)
+        
+        candidates = []
+        for pid in pids:
+            try:
+                proc = process_handles.get(pid)
+                if proc is None:
+                    # New handle: this first reading only sets the baseline
+                    proc = psutil.Process(pid)
+                    process_handles[pid] = proc
+                    process_sort_value(proc, pid)
+                    continue
+                
+                value = process_sort_value(proc, pid)
                 
-                network_usage_rate["bytes_sent_per_sec"] = max(0, bytes_sent_diff / time_diff)
-                network_usage_rate["bytes_recv_per_sec"] = max(0, bytes_recv_diff / time_diff)
+                # Idle processes never make the list
+                if value > 0:
+                    candidates.append((value, pid, proc))
+            except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
+                pass
+        
+        # Partial selection instead of sorting every process on the box
+        top = heapq.nlargest(TOP_PROCESSES, candidates, key=lambda candidate: candidate[0])
         
-        # Update previous values
-        previous_net_io = current_net_io
-        previous_time = current_time
-    
-    # Get top 20 processes by CPU usage
-    try:
         processes = []
-        for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'create_time']):
+        for value, pid, proc in top:
             try:
-                pinfo = proc.info
-                if pinfo['cpu_percent'] is not None:
+                with proc.oneshot():
                     processes.append({
-                        'pid': pinfo['pid'],
-                        'name': pinfo['name'] or 'Unknown',
-                        'cpu_percent': pinfo['cpu_percent'],
-                        'memory_percent': round(pinfo['memory_percent'] or 0, 2),
-                        'create_time': pinfo['create_time']
+                        'pid': pid,
+                        'name': proc.name() or 'Unknown',
+                        'cpu_percent': value if TOP_PROCESSES_SORT == "cpu" else proc.cpu_percent(interval=None),
+                        'memory_percent': round(proc.memory_percent(), 2),
+                        'create_time': proc.create_time()
                     })
             except (psutil.NoSuchProcess, psutil.AccessDenied, psutil.ZombieProcess):
                 pass
         
-        # Sort by CPU usage and get top 20
-        processes.sort(key=lambda x: x['cpu_percent'], reverse=True)
-        top_processes = processes[:20]
+        return processes
         
     except Exception as e:
         print(f"Error getting processes: {e}")
-        top_processes = []
+        return []
+
+def collect_cpu_cores():
+    """CPU usage per logical core since the previous call"""
+    return [["cpu.core_percent", {"core": str(core)}, percent]
+            for core, percent in enumerate(psutil.cpu_percent(interval=None, percpu=True))]
+
+def collect_mountpoints():
+    """Size and usage of every mounted filesystem"""
+    entries = []
+    for partition in psutil.disk_partitions(all=False):
+        try:
+            usage = psutil.disk_usage(partition.mountpoint)
+        except OSError:  # Empty drives and mounts we may not read
+            continue
+        labels = {"mountpoint": partition.mountpoint, "fstype": partition.fstype}
+        entries += [
+            ["disk.total_bytes", labels, usage.total],
+            ["disk.used_bytes", labels, usage.used],
+            ["disk.used_percent", labels, usage.percent]
+        ]
+    return entries
+
+def collect_disk_io():
+    """Read and write counters of every physical disk"""
+    entries = []
+    for disk, io in (psutil.disk_io_counters(perdisk=True) or {}).items():
+        labels = {"disk": disk}
+        entries += [
+            ["disk.read_bytes", labels, io.read_bytes],
+            ["disk.write_bytes", labels, io.write_bytes],
+            ["disk.reads", labels, io.read_count],
+            ["disk.writes", labels, io.write_count]
+        ]
+    return entries
+
+def collect_nics():
+    """Traffic counters of every network interface"""
+    entries = []
+    for nic, io in psutil.net_io_counters(pernic=True).items():
+        labels = {"nic": nic}
+        entries += [
+            ["net.bytes_sent", labels, io.bytes_sent],
+            ["net.bytes_recv", labels, io.bytes_recv],
+            ["net.packets_sent", labels, io.packets_sent],
+            ["net.packets_recv", labels, io.packets_recv],
+            ["net.errors", labels, io.errin + io.errout],
+            ["net.drops", labels, io.dropin + io.dropout]
+        ]
+    return entries
+
+def collect_load():
+    """1, 5 and 15 minute load averages (emulated by psutil on Windows)"""
+    load1, load5, load15 = psutil.getloadavg()
+    return [
+        ["system.load1", {}, load1],
+        ["system.load5", {}, load5],
+        ["system.load15", {}, load15]
+    ]
+
+# Collectors of the labelled series, run together once per snapshot
+METRIC_COLLECTORS = [collect_cpu_cores, collect_mountpoints, collect_disk_io, collect_nics, collect_load]
+
+def collect_metrics():
+    """Run every metric collector; one that fails does not cost the others"""
+    entries = []
+    for collector in METRIC_COLLECTORS:
+        try:
+            entries += collector()
+        except Exception as e:
+            print(f"Error in {collector.__name__}: {e}")
+    return entries
+
+def take_snapshot(previous_net_io, previous_time):
+    """Collect one system snapshot; network rates are relative to the previous one"""
+    # Get disk usage - try different paths for Windows/Linux
+    disk_path = "C:\\" if platform.system() == "Windows" else "/"
+    
+    # Get current network stats
+    current_net_io = psutil.net_io_counters()
+    current_time = time.time()
     
-    return {
-        "cpu_percent": psutil.cpu_percent(interval=1),
+    network_usage_rate = {"bytes_sent_per_sec": 0, "bytes_recv_per_sec": 0}
+    
+    if previous_net_io is not None and previous_time is not None:
+        time_diff = current_time - previous_time
+        if time_diff > 0:
+            bytes_sent_diff = current_net_io.bytes_sent - previous_net_io.bytes_sent
+            bytes_recv_diff = current_net_io.bytes_recv - previous_net_io.bytes_recv
+            
+            network_usage_rate["bytes_sent_per_sec"] = max(0, bytes_sent_diff / time_diff)
+            network_usage_rate["bytes_recv_per_sec"] = max(0, bytes_recv_diff / time_diff)
+    
+    snapshot = {
+        # CPU usage since the previous call, so this never blocks
+        "cpu_percent": psutil.cpu_percent(interval=None),
         "memory": psutil.virtual_memory()._asdict(),
         "disk": psutil.disk_usage(disk_path)._asdict(),
         "network": current_net_io._asdict(),
+        # psutil compensates for OS counters that wrap (nowrap), so within one
+        # client run the byte counters only grow
+        "counter_bits": 64,
         "network_usage": network_usage_rate,
-        "top_processes": top_processes,
+        "metrics": collect_metrics() if METRICS_ENABLED else [],
+        "top_processes": get_top_processes(),
         "hostname": platform.node(),
-        "system": platform.system()
+        "system": platform.system(),
+        "timestamp": current_time
     }
+    
+    return snapshot, current_net_io, current_time
+
+def sampler():
+    """Background thread that adds a snapshot to the history every SAMPLE_INTERVAL seconds"""
+    # Prime the CPU counters so the first snapshot covers a real interval
+    psutil.cpu_percent(interval=None)
+    psutil.cpu_percent(interval=None, percpu=True)
+    previous_net_io = psutil.net_io_counters()
+    previous_time = time.time()
+    sampler_stop.wait(1)
+    
+    while not sampler_stop.is_set():
+        try:
+            snapshot, previous_net_io, previous_time = take_snapshot(previous_net_io, previous_time)
+            history.append(snapshot)
+            snapshot_ready.set()
+        except Exception as e:
+            print(f"Error taking snapshot: {e}")
+        
+        sampler_stop.wait(SAMPLE_INTERVAL)
+
+def trim_processes(samples):
+    """Drop the process lists of all but the newest snapshot to keep batches small"""
+    return [{**sample, "top_processes": []} for sample in samples[:-1]] + samples[-1:]
+
+def push_samples(samples):
+    """POST a gzip-compressed batch of snapshots to the server and return its reply"""
+    payload = {"boot_id": BOOT_ID, "samples": trim_processes(samples)}
+    if msgpack is not None:
+        body, content_type = msgpack.packb(payload), MSGPACK_TYPE
+    else:
+        body, content_type = json.dumps(payload).encode(), "application/json"
+    request = urllib.request.Request(PUSH_URL, data=gzip.compress(body), method="POST", headers={
+        "Authorization": f"Bearer {TOKEN}",
+        "Content-Type": content_type,
+        "Content-Encoding": "gzip"
+    })
+    with urllib.request.urlopen(request, timeout=PUSH_TIMEOUT) as response:
+        return json.load(response)
+
+def pusher():
+    """Background thread that pushes new snapshots to the dashboard server"""
+    acked_seq = 0
+    interval = PUSH_INTERVAL
+    
+    while not sampler_stop.wait(interval):
+        interval = PUSH_INTERVAL
+        samples = history.since(acked_seq)[:PUSH_BATCH_SIZE]
+        if not samples:
+            continue
+        
+        try:
+            result = push_samples(samples)
+            acked_seq = result.get("accepted_seq") or acked_seq
+            interval = result.get("interval", PUSH_INTERVAL)
+            
+            # Drain a backlog quickly once the server is accepting again
+            if len(samples) == PUSH_BATCH_SIZE and result.get("accepted") == len(samples):
+                interval = 1
+        except urllib.error.HTTPError as e:
+            if e.code == 429:
+                # Server is busy; unacknowledged snapshots stay in the ring buffer
+                interval = int(e.headers.get("Retry-After", PUSH_INTERVAL))
+            else:
+                print(f"Error pushing snapshots: {e}")
+        except Exception as e:
+            print(f"Error pushing snapshots: {e}")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Startup
+    print(f"FastAPI client started. Token: {TOKEN}")
+    sampler_thread = threading.Thread(target=sampler, daemon=True)
+    sampler_thread.start()
+    if PUSH_URL:
+        print(f"Pushing snapshots to {PUSH_URL}")
+        pusher_thread = threading.Thread(target=pusher, daemon=True)
+        pusher_thread.start()
+    yield
+    # Shutdown
+    sampler_stop.set()
+
+app = FastAPI(lifespan=lifespan)
+
+# Compress larger responses for scrapers that send Accept-Encoding: gzip
+app.add_middleware(GZipMiddleware, minimum_size=1024)
+
+def encode_response(request, data):
+    """Return msgpack when the caller accepts it, JSON otherwise"""
+    if msgpack is not None and MSGPACK_TYPE in request.headers.get("Accept", ""):
+        return Response(content=msgpack.packb(data), media_type=MSGPACK_TYPE)
+    return data
+
+# Middleware to check token
+@app.middleware("http")
+async def verify_token(request: Request, call_next):
+    auth = request.headers.get("Authorization")
+    if auth != f"Bearer {TOKEN}":
+        raise HTTPException(status_code=401, detail="Unauthorized")
+    return await call_next(request)
+
+@app.get("/systeminfo")
+async def get_system_info(request: Request):
+    # Served from the sampler's snapshot, so concurrent scrapers share one measurement
+    if not snapshot_ready.is_set():
+        raise HTTPException(status_code=503, detail="First snapshot not taken yet")
+    return encode_response(request, history.latest())
+
+@app.get("/systeminfo/since")
+async def get_system_info_since(request: Request, seq: int = 0):
+    # Lets the dashboard catch up on every snapshot taken since its last poll
+    if not snapshot_ready.is_set():
+        raise HTTPException(status_code=503, detail="First snapshot not taken yet")
+    
+    samples = history.since(seq)
+    
+    # Only the newest snapshot carries its process list, older ones just the metrics
+    return encode_response(request, {
+        "boot_id": BOOT_ID,
+        "latest_seq": history.next_seq - 1,
+        "samples": trim_processes(samples)
+    })
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,57 @@
+import base64
+import hashlib
+import hmac
+import secrets
+
+# scrypt cost; raising it rehashes each password at its owner's next login
+SCRYPT_N = 2 ** 14  # CPU/memory cost (16 MiB with r=8)
+SCRYPT_R = 8  # Block size
+SCRYPT_P = 1  # Parallelism
+SALT_BYTES = 16
+KEY_BYTES = 32
+
+# Bytes of randomness in a generated API token
+TOKEN_BYTES = 32
+
+def b64encode(data):
+    """Base64 text of bytes, as used in stored hashes"""
+    return base64.b64encode(data).decode('ascii')
+
+def scrypt(password, salt, n, r, p):
+    """Derive a key from a password with the given scrypt parameters"""
+    return hashlib.scrypt(password.encode(), salt=salt, n=n, r=r, p=p,
+                          maxmem=256 * n * r * p, dklen=KEY_BYTES)
+
+def hash_password(password):
+    """Hash a password as scrypt$n$r$p$salt$key with a fresh salt"""
+    salt = secrets.token_bytes(SALT_BYTES)
+    key = scrypt(password, salt, SCRYPT_N, SCRYPT_R, SCRYPT_P)
+    return f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}${b64encode(salt)}${b64encode(key)}'
+
+def verify_password(password, stored):
+    """Check a password against a stored hash, scrypt or a legacy unsalted SHA-256 hex digest"""
+    if stored.startswith('scrypt$'):
+        try:
+            _, n, r, p, salt, key = stored.split('$')
+            derived = scrypt(password, base64.b64decode(salt), int(n), int(r), int(p))
+        except ValueError:
+            return False
+        return hmac.compare_digest(derived, base64.b64decode(key))
+    
+    return hmac.compare_digest(hashlib.sha256(password.encode()).hexdigest(), stored)
+
+def needs_rehash(stored):
+    """Whether a stored hash is legacy or uses other scrypt parameters than configured"""
+    return not stored.startswith(f'scrypt${SCRYPT_N}${SCRYPT_R}${SCRYPT_P}$')
+
+def generate_token():
+    """A new random API token, shown to its owner once"""
+    return secrets.token_urlsafe(TOKEN_BYTES)
+
+def token_digest(token):
+    """What is stored and looked up for a token
+    
+    Tokens are long random strings rather than passwords, so a plain SHA-256
+    keeps them safe at rest without the cost of a KDF on every request.
+    """
+    return hashlib.sha256(token.encode()).hexdigest()
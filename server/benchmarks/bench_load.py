@@ -0,0 +1,499 @@
+"""Load-test the server against a simulated fleet of client agents.
+
+Starts the server in a subprocess on a throwaway database, serves N fake
+agents from one local HTTP listener (each at http://127.0.0.1:<port>/agent/<n>
+with its own Bearer token, speaking the /systeminfo and /systeminfo/since API
+of client/client.py), registers them through /api/add_computer and lets the
+collector poll them while simulated dashboard users request the /api/*
+endpoints. After a warm-up, it measures:
+
+- collector: achieved poll rate, gaps between consecutive polls of each agent
+  (the collector polls every agent on its own schedule, so this is the
+  per-agent counterpart of the old sweep time), poll start delay and latency
+- ingest: samples committed per second, write batch time and queue depth
+- database growth in bytes per minute and per sample
+- latency percentiles and error counts per /api/* endpoint
+
+Agent data, failures and dashboard requests are drawn from --seed, and the
+JSON written by --output can be passed to --compare on a later run to print
+the change of every figure.
+
+Usage:
+    python benchmarks/bench_load.py [--agents 200] [--interval 5] [--duration 60]
+        [--latency 0.02] [--failure-rate 0.01] [--processes 20] [--dashboards 4]
+        [--output results.json] [--compare baseline.json]
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import requests
+
+try:
+    import msgpack
+except ImportError:  # Agents answer in JSON when msgpack is not installed
+    msgpack = None
+
+SERVER_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+
+SNAPSHOT_INTERVAL = 5  # Seconds between the snapshots an agent takes, like client.py
+HISTORY_SIZE = 720  # Snapshots an agent keeps for /systeminfo/since, like client.py
+MSGPACK_TYPE = 'application/x-msgpack'
+
+# Runs the server with its background threads, without the debug reloader
+SERVER_BOOT = '''
+import sys
+import db, server
+db.configure(sys.argv[1])
+server.POLL_MIN_INTERVAL = 1
+server.init_db()
+server.start_background_workers()
+server.app.run(host='127.0.0.1', port=int(sys.argv[2]), threaded=True)
+'''
+
+# Dashboard requests as (label, path template); {id} is a random registered computer
+DASHBOARD_REQUESTS = [
+    ('fleet', '/api/fleet'),
+    ('fleet summary', '/api/fleet/summary?metric=cpu_percent&hours=1'),
+    ('fleet top', '/api/fleet/top?metric=cpu_percent&hours=1&k=10'),
+    ('stats', '/api/stats/{id}'),
+    ('processes', '/api/processes/{id}'),
+    ('history 24h', '/api/history/{id}?hours=24'),
+    ('cpu graph 24h', '/api/cpu_graph/{id}?hours=24'),
+    ('network graph 24h', '/api/network_graph/{id}?hours=24'),
+]
+
+class FakeAgent:
+    """One simulated client: its token, snapshot history and poll log"""
+    
+    def __init__(self, index, seed, processes):
+        self.index = index
+        self.token = f'bench-token-{index}'
+        self.boot_id = f'bench-{seed}-{index}'
+        self.rng = random.Random(f'{seed}-{index}')
+        self.lock = threading.Lock()
+        self.history = []
+        self.next_seq = 1
+        self.next_snapshot = None
+        self.polls = []  # (time.monotonic(), failed) of every request
+        self.bytes_sent = self.rng.randint(0, 2**40)
+        self.bytes_recv = self.rng.randint(0, 2**40)
+        
+        # A stable pool of processes so the server sees starts, exits and changes
+        self.processes = [{
+            'pid': self.rng.randint(100, 2**22),
+            'name': f'proc-{self.rng.randint(0, 999)}',
+            'create_time': time.time() - self.rng.uniform(0, 86400),
+            'cpu_percent': self.rng.uniform(0, 50),
+            'memory_percent': self.rng.uniform(0, 10)
+        } for _ in range(processes * 2)]
+        self.top = processes
+    
+    def take_snapshot(self, timestamp):
+        """Append one synthetic snapshot shaped like client.py's"""
+        sent = self.rng.randint(0, 10**6)
+        recv = self.rng.randint(0, 10**7)
+        self.bytes_sent += sent
+        self.bytes_recv += recv
+        
+        for proc in self.processes:
+            proc['cpu_percent'] = max(0.0, proc['cpu_percent'] + self.rng.gauss(0, 3))
+        if self.processes and self.rng.random() < 0.05:
+            # Now and then a process exits and another starts
+            self.processes[self.rng.randrange(len(self.processes))].update(
+                pid=self.rng.randint(100, 2**22), create_time=timestamp)
+        top = sorted(self.processes, key=lambda proc: proc['cpu_percent'], reverse=True)[:self.top]
+        
+        self.history.append({
+            'seq': self.next_seq,
+            'cpu_percent': self.rng.uniform(0, 100),
+            'memory': {'total': 16 * 2**30, 'used': self.rng.randint(2**30, 15 * 2**30),
+                       'percent': self.rng.uniform(5, 95)},
+            'disk': {'total': 512 * 2**30, 'used': 256 * 2**30, 'free': 256 * 2**30, 'percent': 50.0},
+            'network': {'bytes_sent': self.bytes_sent, 'bytes_recv': self.bytes_recv},
+            'network_usage': {'bytes_sent_per_sec': sent / SNAPSHOT_INTERVAL,
+                              'bytes_recv_per_sec': recv / SNAPSHOT_INTERVAL},
+            'top_processes': [dict(proc) for proc in top],
+            'hostname': f'bench-{self.index}',
+            'system': 'Linux',
+            'timestamp': timestamp
+        })
+        self.next_seq += 1
+        del self.history[:-HISTORY_SIZE]
+    
+    def since(self, seq, now):
+        """Take the snapshots due by now and return the /systeminfo/since payload"""
+        with self.lock:
+            if self.next_snapshot is None:
+                self.next_snapshot = now
+            while self.next_snapshot <= now:
+                self.take_snapshot(self.next_snapshot)
+                self.next_snapshot += SNAPSHOT_INTERVAL
+            
+            samples = [sample for sample in self.history if sample['seq'] > seq]
+            # Only the newest snapshot carries its process list, as in client.py
+            samples = [{**sample, 'top_processes': []} for sample in samples[:-1]] + samples[-1:]
+            return {'boot_id': self.boot_id, 'latest_seq': self.next_seq - 1, 'samples': samples}
+    
+    def accept(self, failure_rate, latency):
+        """Log a request from the collector and draw (fails, seconds to answer)"""
+        with self.lock:
+            failed = self.rng.random() < failure_rate
+            self.polls.append((time.monotonic(), failed))
+            return failed, latency * self.rng.uniform(0.5, 1.5)
+
+class AgentHandler(BaseHTTPRequestHandler):
+    """Serves /agent/<n>/systeminfo[/since] for every fake agent"""
+    
+    protocol_version = 'HTTP/1.1'
+    
+    def do_GET(self):
+        url = urlsplit(self.path)
+        parts = url.path.strip('/').split('/')
+        agent = self.server.agents.get(parts[1]) if len(parts) > 1 and parts[0] == 'agent' else None
+        if agent is None or parts[2:] not in (['systeminfo'], ['systeminfo', 'since']):
+            return self.send_error(404)
+        
+        if self.headers.get('Authorization') != f'Bearer {agent.token}':
+            return self.send_error(401)
+        
+        failed, delay = agent.accept(self.server.failure_rate, self.server.latency)
+        time.sleep(delay)
+        if failed:
+            return self.send_error(503)
+        
+        seq = int(parse_qs(url.query).get('seq', ['0'])[0]) if parts[-1] == 'since' else None
+        data = agent.since(seq or 0, time.time())
+        if seq is None:
+            data = data['samples'][-1]
+        
+        if msgpack is not None and MSGPACK_TYPE in self.headers.get('Accept', ''):
+            body, content_type = msgpack.packb(data), MSGPACK_TYPE
+        else:
+            body, content_type = json.dumps(data).encode(), 'application/json'
+        
+        self.send_response(200)
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class LatencyLog:
+    """Latencies and errors of dashboard requests per endpoint label"""
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.measuring = False
+        self.latencies = {}
+        self.errors = {}
+    
+    def record(self, label, seconds, ok):
+        """Log one request if measuring has started"""
+        with self.lock:
+            if not self.measuring:
+                return
+            self.latencies.setdefault(label, []).append(seconds * 1000)
+            if not ok:
+                self.errors[label] = self.errors.get(label, 0) + 1
+
+def free_port():
+    """Find a free local TCP port"""
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def percentile(values, percent):
+    """Nearest-rank percentile of a list of numbers"""
+    ordered = sorted(values)
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, max(0, int(round(percent / 100 * len(ordered))) - 1))]
+
+def scrape_metrics(session, base):
+    """Sum every /metrics series by name, ignoring labels"""
+    totals = {}
+    for line in session.get(f'{base}/metrics', timeout=30).text.splitlines():
+        if not line or line.startswith('#'):
+            continue
+        series, value = line.rsplit(' ', 1)
+        name = series.split('{', 1)[0]
+        totals[name] = totals.get(name, 0.0) + float(value)
+    return totals
+
+def database_bytes(path):
+    """Size of the database and its write-ahead log"""
+    return sum(os.path.getsize(file) for file in (path, path + '-wal') if os.path.exists(file))
+
+def start_server(workdir, port, username, password):
+    """Start the server subprocess and return (process, logged-in session)"""
+    log = open(os.path.join(workdir, 'server.log'), 'w')
+    process = subprocess.Popen([sys.executable, '-c', SERVER_BOOT, os.path.join(workdir, 'bench.db'), str(port)],
+                               cwd=SERVER_DIR, stdout=log, stderr=subprocess.STDOUT)
+    base = f'http://127.0.0.1:{port}'
+    session = requests.Session()
+    
+    deadline = time.monotonic() + 30
+    while True:
+        if process.poll() is not None:
+            sys.exit(f"Server exited during startup, see {log.name}")
+        try:
+            session.get(f'{base}/login', timeout=1)
+            break
+        except requests.ConnectionError:
+            if time.monotonic() > deadline:
+                process.kill()
+                sys.exit("Server did not start within 30 seconds")
+            time.sleep(0.2)
+    
+    response = session.post(f'{base}/login', data={'username': username, 'password': password}, timeout=10)
+    if session.get(f'{base}/api/computers', timeout=10, allow_redirects=False).status_code != 200:
+        process.kill()
+        sys.exit(f"Login as {username} failed ({response.status_code})")
+    return process, session
+
+def register_agents(session, base, agent_port, agents, interval):
+    """Add every agent through /api/add_computer and return their computer ids"""
+    for index, agent in agents.items():
+        response = session.post(f'{base}/api/add_computer', json={
+            'name': f'bench-{index}',
+            'url': f'http://127.0.0.1:{agent_port}/agent/{index}',
+            'token': agent.token,
+            'poll_interval': interval
+        }, timeout=30)
+        response.raise_for_status()
+    
+    return [computer['id'] for computer in session.get(f'{base}/api/computers', timeout=30).json()]
+
+def dashboard_user(base, cookies, computer_ids, rng, think, stop, log):
+    """Request random dashboard endpoints until stopped"""
+    session = requests.Session()
+    session.cookies.update(cookies)
+    
+    while not stop.is_set():
+        label, path = rng.choice(DASHBOARD_REQUESTS)
+        started = time.perf_counter()
+        try:
+            ok = session.get(base + path.format(id=rng.choice(computer_ids)), timeout=60).status_code < 400
+        except requests.RequestException:
+            ok = False
+        log.record(label, time.perf_counter() - started, ok)
+        
+        if think:
+            stop.wait(rng.expovariate(1 / think))
+
+def summarize_polls(agents, since, until, interval):
+    """Poll rate and per-agent poll gap statistics within [since, until)"""
+    gaps = []
+    polls = 0
+    failures = 0
+    for agent in agents.values():
+        with agent.lock:
+            polled = [(t, failed) for t, failed in agent.polls if since <= t < until]
+        times = [t for t, _ in polled]
+        failures += sum(failed for _, failed in polled)
+        polls += len(times)
+        gaps += [later - earlier for earlier, later in zip(times, times[1:])]
+    
+    duration = until - since
+    return {
+        'polls_per_sec': polls / duration,
+        'target_polls_per_sec': len(agents) / interval,
+        'poll_gap_p50_s': percentile(gaps, 50),
+        'poll_gap_p95_s': percentile(gaps, 95),
+        'poll_gap_max_s': max(gaps) if gaps else None,
+        'agent_failures': failures
+    }
+
+def run(args, workdir):
+    """Run one load test and return its results"""
+    agents = {str(index): FakeAgent(index, args.seed, args.processes) for index in range(1, args.agents + 1)}
+    agent_server = ThreadingHTTPServer(('127.0.0.1', 0), AgentHandler)
+    agent_server.daemon_threads = True
+    agent_server.agents = agents
+    agent_server.failure_rate = args.failure_rate
+    agent_server.latency = args.latency
+    threading.Thread(target=agent_server.serve_forever, daemon=True).start()
+    
+    port = free_port()
+    base = f'http://127.0.0.1:{port}'
+    process, session = start_server(workdir, port, args.username, args.password)
+    db_path = os.path.join(workdir, 'bench.db')
+    
+    try:
+        computer_ids = register_agents(session, base, agent_server.server_address[1], agents, args.interval)
+        
+        stop = threading.Event()
+        log = LatencyLog()
+        users = [threading.Thread(target=dashboard_user, daemon=True, args=(
+            base, session.cookies, computer_ids, random.Random(f'{args.seed}-dashboard-{n}'), args.think, stop, log
+        )) for n in range(args.dashboards)]
+        for user in users:
+            user.start()
+        
+        time.sleep(args.warmup)
+        
+        start_metrics = scrape_metrics(session, base)
+        start_bytes = database_bytes(db_path)
+        start_time = time.monotonic()
+        log.measuring = True
+        
+        queue_depths = []
+        while time.monotonic() - start_time < args.duration:
+            time.sleep(min(5, args.duration))
+            queue_depths.append(scrape_metrics(session, base).get('monitor_write_queue_samples', 0))
+        
+        log.measuring = False
+        end_time = time.monotonic()
+        end_metrics = scrape_metrics(session, base)
+        end_bytes = database_bytes(db_path)
+        scheduler = session.get(f'{base}/api/collector/status', timeout=30).json()['scheduler']
+        
+        stop.set()
+        for user in users:
+            user.join()
+    finally:
+        process.terminate()
+        process.wait()
+        agent_server.shutdown()
+    
+    def delta(name):
+        return end_metrics.get(name, 0) - start_metrics.get(name, 0)
+    
+    def mean_ms(name):
+        count = delta(f'{name}_count')
+        return delta(f'{name}_sum') / count * 1000 if count else None
+    
+    duration = end_time - start_time
+    written = delta('monitor_written_samples_total')
+    
+    collector = summarize_polls(agents, start_time, end_time, args.interval)
+    collector.update({
+        'poll_mean_ms': mean_ms('monitor_poll_seconds'),
+        'poll_delay_mean_ms': mean_ms('monitor_poll_delay_seconds'),
+        'poll_delay_p95_s': scheduler['drift_p95'],
+        'poll_delay_max_s': scheduler['drift_max'],
+        'hosts_backing_off': scheduler['backing_off']
+    })
+    
+    return {
+        'collector': collector,
+        'ingest': {
+            'samples_per_sec': written / duration,
+            'write_batch_mean_ms': mean_ms('monitor_write_batch_seconds'),
+            'write_errors': delta('monitor_write_errors_total'),
+            'queue_depth_max': max(queue_depths) if queue_depths else 0
+        },
+        'database': {
+            'bytes_start': start_bytes,
+            'bytes_end': end_bytes,
+            'bytes_per_min': (end_bytes - start_bytes) / duration * 60,
+            'bytes_per_sample': (end_bytes - start_bytes) / written if written else None
+        },
+        'api': {
+            label: {
+                'requests': len(latencies),
+                'errors': log.errors.get(label, 0),
+                'p50_ms': percentile(latencies, 50),
+                'p95_ms': percentile(latencies, 95),
+                'p99_ms': percentile(latencies, 99)
+            }
+            for label, latencies in sorted(log.latencies.items())
+        }
+    }
+
+def flatten(results, prefix=''):
+    """Flatten nested result sections into {'section.name': value}"""
+    flat = {}
+    for key, value in results.items():
+        if isinstance(value, dict):
+            flat.update(flatten(value, f'{prefix}{key}.'))
+        else:
+            flat[prefix + key] = value
+    return flat
+
+def format_number(value):
+    """Format a result for the table: '-' for missing, 3 decimals below 100"""
+    if value is None:
+        return '-'
+    if isinstance(value, float) and not value.is_integer():
+        return f'{value:.3f}' if abs(value) < 100 else f'{value:.0f}'
+    return str(int(value))
+
+def print_results(results, baseline=None):
+    """Print every figure, with the baseline and relative change when given"""
+    flat = flatten(results)
+    old = flatten(baseline) if baseline else {}
+    
+    header = f"{'metric':<36} {'value':>12}"
+    if baseline:
+        header += f" {'baseline':>12} {'change':>8}"
+    print(header)
+    
+    for name, value in flat.items():
+        line = f"{name:<36} {format_number(value):>12}"
+        if baseline:
+            before = old.get(name)
+            change = '-'
+            if isinstance(value, (int, float)) and isinstance(before, (int, float)) and before:
+                change = f'{(value - before) / abs(before) * 100:+.1f}%'
+            line += f" {format_number(before):>12} {change:>8}"
+        print(line)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--agents', type=int, default=200, help='number of simulated client agents')
+    parser.add_argument('--interval', type=int, default=5, help='poll_interval registered for every agent')
+    parser.add_argument('--latency', type=float, default=0.02, help='mean seconds an agent takes to answer')
+    parser.add_argument('--failure-rate', type=float, default=0.01, help='fraction of agent requests answered with 503')
+    parser.add_argument('--processes', type=int, default=20, help='top processes in each snapshot (payload size)')
+    parser.add_argument('--dashboards', type=int, default=4, help='concurrent simulated dashboard users')
+    parser.add_argument('--think', type=float, default=0.5, help='mean seconds between requests of a dashboard user')
+    parser.add_argument('--warmup', type=float, default=15, help='seconds before measuring starts')
+    parser.add_argument('--duration', type=float, default=60, help='seconds measured')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for reproducible agents and requests')
+    parser.add_argument('--username', default='admin', help='dashboard login')
+    parser.add_argument('--password', default='admin123', help='dashboard password')
+    parser.add_argument('--output', help='write the configuration and results as JSON to this file')
+    parser.add_argument('--compare', help='JSON written by an earlier --output run to compare against')
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        differing = {key: value for key, value in baseline['config'].items()
+                     if key not in ('output', 'compare') and vars(args).get(key) != value}
+        if differing:
+            print(f"Note: baseline ran with different settings: {differing}")
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        results = run(args, tmp)
+    
+    print_results(results, baseline['results'] if baseline else None)
+    
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({
+                'config': vars(args),
+                'environment': {'python': platform.python_version(), 'platform': platform.platform(),
+                                'cpus': os.cpu_count(), 'msgpack': msgpack is not None},
+                'timestamp': int(time.time()),
+                'results': results
+            }, f, indent=2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,156 @@
+"""Benchmark the dashboard's stats queries against table size.
+
+Builds throwaway databases with the current schema, fills them with
+synthetic samples spread over a fleet of computers, and times the queries
+behind /api/stats, /api/history, /api/cpu_graph, /api/network_graph and the
+process event log with and without the (computer_id, timestamp) indexes.
+
+Usage:
+    python benchmarks/bench_stats_queries.py [--sizes 10000 100000 1000000] [--hosts 50]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import sqlite3
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server
+
+SAMPLE_INTERVAL = 30
+
+QUERIES = {
+    'latest stats': ('''
+        SELECT * FROM stats
+        WHERE computer_id = ?
+        ORDER BY timestamp DESC
+        LIMIT 1
+    ''', 0),
+    'history 24h': ('''
+        SELECT timestamp, cpu_percent, memory_percent, disk_percent
+        FROM stats
+        WHERE computer_id = ? AND timestamp > ?
+        ORDER BY timestamp
+    ''', 24 * 3600),
+    'cpu graph 24h': ('''
+        SELECT timestamp, cpu_percent
+        FROM stats
+        WHERE computer_id = ? AND timestamp > ?
+        ORDER BY timestamp
+    ''', 24 * 3600),
+    'network graph 24h': ('''
+        SELECT timestamp, network_sent_per_sec, network_recv_per_sec,
+               network_bytes_sent, network_bytes_recv
+        FROM stats
+        WHERE computer_id = ? AND timestamp > ?
+        ORDER BY timestamp
+    ''', 24 * 3600),
+    'process events 1h': ('''
+        SELECT timestamp, event, pid, name, cpu_percent, memory_percent
+        FROM process_events
+        WHERE computer_id = ? AND timestamp > ?
+        ORDER BY timestamp
+    ''', 3600),
+}
+
+def build_database(path, rows, hosts):
+    """Create a migrated database holding `rows` stats samples spread over `hosts`"""
+    server.db.configure(path)
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.init_db()
+    
+    conn = sqlite3.connect(path)
+    now = int(time.time())
+    per_host = rows // hosts
+    
+    conn.executemany(
+        'INSERT INTO computers (name, url, token, status) VALUES (?, ?, ?, ?)',
+        [(f'host-{i}', f'http://host-{i}:8000', 'token', 'online') for i in range(1, hosts + 1)]
+    )
+    
+    for computer_id in range(1, hosts + 1):
+        stats_rows = []
+        process_rows = []
+        for n in range(per_host):
+            timestamp = now - (per_host - n) * SAMPLE_INTERVAL
+            stats_rows.append((
+                computer_id, timestamp, random.uniform(0, 100),
+                16 << 30, 8 << 30, 50.0, 512 << 30, 256 << 30, 50.0,
+                n * 1000, n * 2000, 1000.0, 2000.0
+            ))
+            if n % 10 == 0:
+                pid = random.randint(1, 30000)
+                process_rows.append((computer_id, timestamp, 'start', pid, now, f'proc-{pid}', random.uniform(0, 10), 1.0))
+        conn.executemany('''
+            INSERT INTO stats (computer_id, timestamp, cpu_percent, memory_total, memory_used,
+                             memory_percent, disk_total, disk_used, disk_percent,
+                             network_bytes_sent, network_bytes_recv,
+                             network_sent_per_sec, network_recv_per_sec)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', stats_rows)
+        conn.executemany('''
+            INSERT INTO process_events (computer_id, timestamp, event, pid, create_time,
+                                        name, cpu_percent, memory_percent)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', process_rows)
+    
+    conn.commit()
+    conn.execute('ANALYZE')
+    return conn
+
+def time_queries(conn, hosts, repeat):
+    """Return the median latency in milliseconds of each query over random hosts"""
+    results = {}
+    now = int(time.time())
+    
+    for label, (sql, window) in QUERIES.items():
+        timings = []
+        for _ in range(repeat):
+            computer_id = random.randint(1, hosts)
+            params = (computer_id,) if not window else (computer_id, now - window)
+            started = time.perf_counter()
+            conn.execute(sql, params).fetchall()
+            timings.append((time.perf_counter() - started) * 1000)
+        results[label] = statistics.median(timings)
+    
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--sizes', type=int, nargs='+', default=[10000, 100000, 1000000],
+                        help='number of stats rows per run')
+    parser.add_argument('--hosts', type=int, default=50, help='number of simulated computers')
+    parser.add_argument('--repeat', type=int, default=20, help='timed runs per query')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for reproducible data')
+    args = parser.parse_args()
+    
+    random.seed(args.seed)
+    
+    print(f"{'rows':>10}  {'query':<18} {'indexed ms':>11} {'scan ms':>10} {'speedup':>8}")
+    
+    for rows in args.sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            conn = build_database(os.path.join(tmp, 'bench.db'), rows, args.hosts)
+            
+            indexed = time_queries(conn, args.hosts, args.repeat)
+            
+            conn.execute('DROP INDEX idx_stats_computer_time')
+            conn.execute('DROP INDEX idx_stats_timestamp')
+            conn.execute('DROP INDEX idx_process_events_computer_time')
+            conn.execute('DROP INDEX idx_process_events_timestamp')
+            scanned = time_queries(conn, args.hosts, args.repeat)
+            
+            conn.close()
+        
+        for label in QUERIES:
+            speedup = scanned[label] / indexed[label] if indexed[label] else float('inf')
+            print(f"{rows:>10}  {label:<18} {indexed[label]:>11.3f} {scanned[label]:>10.3f} {speedup:>7.1f}x")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Benchmark the SQLite and columnar storage backends.
+
+Fills a fresh store of each backend with synthetic samples for a fleet of
+computers, taken every RAW_SAMPLE_INTERVAL seconds over the past few days,
+writing them in batches of WRITE_BATCH_SIZE like the sample writer. Reports
+the ingest rate and the median time of raw 24 h and 7 d cpu_percent range
+queries, the reads behind /api/cpu_graph.
+
+Usage:
+    python benchmarks/bench_storage.py [--hosts 10] [--days 7] [--repeat 10]
+"""
+import argparse
+import contextlib
+import io
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import db
+import server
+
+WINDOWS = {'24 h': 24, '7 d': 7 * 24}
+
+def generate_batches(hosts, days):
+    """Yield WRITE_BATCH_SIZE lists of stats rows in arrival order"""
+    now = int(time.time())
+    start = now - days * 86400
+    batch = []
+    
+    for timestamp in range(start, now, server.RAW_SAMPLE_INTERVAL):
+        for computer_id in range(1, hosts + 1):
+            sent = (timestamp - start) * 1000
+            batch.append((
+                computer_id, timestamp, random.uniform(0, 100),
+                16 * 2**30, 8 * 2**30, 50.0,
+                512 * 2**30, 256 * 2**30, 50.0,
+                sent, sent * 2, 1000.0, 2000.0
+            ))
+            if len(batch) == server.WRITE_BATCH_SIZE:
+                yield batch
+                batch = []
+    
+    if batch:
+        yield batch
+
+def run_backend(backend, workdir, hosts, days, repeat):
+    """Ingest into one backend and time its range queries"""
+    db.configure(os.path.join(workdir, f'{backend}.db'))
+    with contextlib.redirect_stdout(io.StringIO()):
+        server.init_db()
+    
+    if backend == 'columnar':
+        storage = server.ColumnarStorage(os.path.join(workdir, 'series'))
+    else:
+        storage = server.SQLiteStorage()
+    
+    conn = db.connect()
+    rows = 0
+    elapsed = 0.0
+    for batch in generate_batches(hosts, days):
+        started = time.perf_counter()
+        with conn:
+            storage.append(conn.cursor(), batch)
+        elapsed += time.perf_counter() - started
+        rows += len(batch)
+    
+    results = {'rows': rows, 'ingest': rows / elapsed}
+    for label, hours in WINDOWS.items():
+        timings = []
+        for _ in range(repeat):
+            computer_id = random.randint(1, hosts)
+            started = time.perf_counter()
+            # A point budget this large always reads raw samples
+            storage.series(conn.cursor(), computer_id, hours, 10**9, ['cpu_percent'])
+            timings.append((time.perf_counter() - started) * 1000)
+        results[label] = statistics.median(timings)
+    
+    conn.close()
+    return results
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--hosts', type=int, default=10, help='number of simulated computers')
+    parser.add_argument('--days', type=int, default=7, help='days of samples per computer')
+    parser.add_argument('--repeat', type=int, default=10, help='timed runs per query')
+    parser.add_argument('--seed', type=int, default=42, help='random seed for reproducible data')
+    args = parser.parse_args()
+    
+    if server.columnar is None:
+        sys.exit("The columnar backend requires NumPy (pip install numpy)")
+    
+    print(f"{'backend':<10} {'rows':>10} {'ingest rows/s':>14} " +
+          ' '.join(f'{label + " ms":>10}' for label in WINDOWS))
+    
+    for backend in ('sqlite', 'columnar'):
+        random.seed(args.seed)
+        with tempfile.TemporaryDirectory() as tmp:
+            results = run_backend(backend, tmp, args.hosts, args.days, args.repeat)
+        
+        print(f"{backend:<10} {results['rows']:>10} {results['ingest']:>14.0f} " +
+              ' '.join(f'{results[label]:>10.2f}' for label in WINDOWS))
+
+if __name__ == '__main__':
+    main()
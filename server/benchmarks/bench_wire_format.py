@@ -0,0 +1,103 @@
+"""Benchmark the /systeminfo wire formats: bytes per sample and decode time.
+
+Builds snapshots shaped like the client's (full memory, disk and network
+dicts plus the top process list) from this machine's psutil readings and
+compares JSON and msgpack, each with and without gzip, both for a single
+/systeminfo snapshot and for a /systeminfo/since batch.
+
+Usage:
+    python benchmarks/bench_wire_format.py [--batch 6] [--repeat 2000]
+"""
+import argparse
+import gzip
+import json
+import os
+import platform
+import sys
+import time
+
+import psutil
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+import server
+
+def make_snapshot(seq):
+    """Build one snapshot with the same fields the client reports"""
+    processes = []
+    for proc in psutil.process_iter(['pid', 'name', 'cpu_percent', 'memory_percent', 'create_time']):
+        info = proc.info
+        processes.append({
+            'pid': info['pid'],
+            'name': info['name'] or 'Unknown',
+            'cpu_percent': info['cpu_percent'] or 0.0,
+            'memory_percent': round(info['memory_percent'] or 0, 2),
+            'create_time': info['create_time']
+        })
+    
+    return {
+        'cpu_percent': psutil.cpu_percent(interval=None),
+        'memory': psutil.virtual_memory()._asdict(),
+        'disk': psutil.disk_usage('/')._asdict(),
+        'network': psutil.net_io_counters()._asdict(),
+        'network_usage': {'bytes_sent_per_sec': 1234.5, 'bytes_recv_per_sec': 6789.0},
+        'top_processes': processes[:20],
+        'hostname': platform.node(),
+        'system': platform.system(),
+        'timestamp': time.time(),
+        'seq': seq
+    }
+
+def encoders():
+    """Map of format name to (encode, content type, gzip) for every available format"""
+    formats = {
+        'json': (lambda data: json.dumps(data).encode(), 'application/json', False),
+        'json+gzip': (lambda data: json.dumps(data).encode(), 'application/json', True),
+    }
+    if server.msgpack is not None:
+        formats['msgpack'] = (server.msgpack.packb, server.MSGPACK_TYPE, False)
+        formats['msgpack+gzip'] = (server.msgpack.packb, server.MSGPACK_TYPE, True)
+    return formats
+
+def measure(payload, samples, repeat):
+    """Print size per sample and decode time per sample for every format"""
+    baseline = None
+    
+    for name, (encode, content_type, compress) in encoders().items():
+        body = encode(payload)
+        if compress:
+            body = gzip.compress(body)
+        
+        started = time.perf_counter()
+        for _ in range(repeat):
+            raw = gzip.decompress(body) if compress else body
+            server.decode_payload(raw, content_type)
+        decode_us = (time.perf_counter() - started) / repeat / samples * 1e6
+        
+        size = len(body) / samples
+        baseline = baseline or size
+        print(f"  {name:<14} {size:>10.0f} B/sample {size / baseline:>7.0%} {decode_us:>10.1f} us/sample")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--batch', type=int, default=6,
+                        help='snapshots per /systeminfo/since response (30 s poll / 5 s sampling)')
+    parser.add_argument('--repeat', type=int, default=2000, help='decode iterations per format')
+    args = parser.parse_args()
+    
+    psutil.cpu_percent(interval=None)
+    snapshots = [make_snapshot(seq) for seq in range(1, args.batch + 1)]
+    
+    if server.msgpack is None:
+        print("msgpack is not installed; only JSON is measured")
+    
+    print("/systeminfo (single snapshot):")
+    measure(snapshots[-1], 1, args.repeat)
+    
+    # Same trimming as the client: only the newest snapshot keeps its process list
+    batch = [{**snapshot, 'top_processes': []} for snapshot in snapshots[:-1]] + snapshots[-1:]
+    print(f"/systeminfo/since (batch of {args.batch}):")
+    measure({'boot_id': 'benchmark', 'latest_seq': args.batch, 'samples': batch}, args.batch, args.repeat)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+
+# Returned by TTLCache.get when nothing unexpired is cached for a key, so that
+# None can be cached as a result too
+MISS = object()
+
+class TTLCache:
+    """Values kept for a fixed number of seconds
+    
+    Expired entries are replaced on the next request; the oldest entry is
+    dropped once max_size is reached. Used for fleet-wide aggregates and for
+    the results of credential checks.
+    """
+    
+    def __init__(self, ttl, max_size):
+        self.ttl = ttl
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def get(self, key):
+        """Get a cached value that has not expired, or MISS"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None or entry[0] <= time.monotonic():
+                self.misses += 1
+                return MISS
+            self.hits += 1
+            return entry[1]
+    
+    def put(self, key, value):
+        """Cache a value for ttl seconds"""
+        with self.lock:
+            self.entries[key] = (time.monotonic() + self.ttl, value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def clear(self):
+        """Forget every cached value, e.g. after a token was revoked"""
+        with self.lock:
+            self.entries.clear()
+    
+    def info(self):
+        """Size and hit/miss counters for monitoring"""
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses
+            }
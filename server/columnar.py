@@ -0,0 +1,223 @@
+import os
+import shutil
+import threading
+from datetime import datetime, timezone
+
+import numpy as np
+
+TIMESTAMP_FILE = 'timestamp.i64'
+DAY_FORMAT = '%Y-%m-%d'
+
+def summarize_buckets(timestamps, values, seconds, gauges, extremes=False):
+    """Aggregate ordered samples into fixed buckets of the given width
+    
+    The first `gauges` columns are averaged per bucket; the remaining columns
+    are counters and keep their last value. With extremes, each bucket gives a
+    row of gauge minimums at its start and one of maximums half a bucket later.
+    Returns (timestamps, summary).
+    """
+    buckets = timestamps - timestamps % seconds
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    ends = np.r_[starts[1:], len(buckets)]
+    counters = values[ends - 1, gauges:]
+    
+    if not extremes:
+        averages = np.add.reduceat(values[:, :gauges], starts, axis=0) / (ends - starts)[:, None]
+        return buckets[starts], np.hstack([averages, counters])
+    
+    minimums = np.hstack([np.minimum.reduceat(values[:, :gauges], starts, axis=0), counters])
+    maximums = np.hstack([np.maximum.reduceat(values[:, :gauges], starts, axis=0), counters])
+    times = np.column_stack([buckets[starts], buckets[starts] + seconds // 2]).ravel()
+    return times, np.stack([minimums, maximums], axis=1).reshape(-1, values.shape[1])
+
+def rollup_buckets(timestamps, values, seconds, gauges):
+    """Summarise ordered samples per bucket the way the rollup tables do
+    
+    Each of the first `gauges` columns gives its min, max and average per
+    bucket, and each remaining counter column its max. Returns
+    (bucket starts, sample counts, summary).
+    """
+    buckets = timestamps - timestamps % seconds
+    starts = np.flatnonzero(np.r_[True, buckets[1:] != buckets[:-1]])
+    counts = np.diff(np.r_[starts, len(buckets)])
+    
+    columns = []
+    for index in range(values.shape[1]):
+        column = values[:, index]
+        if index < gauges:
+            columns += [
+                np.minimum.reduceat(column, starts),
+                np.maximum.reduceat(column, starts),
+                np.add.reduceat(column, starts) / counts
+            ]
+        else:
+            columns.append(np.maximum.reduceat(column, starts))
+    
+    return buckets[starts], counts, np.column_stack(columns)
+
+class ColumnarStore:
+    """Append-only time series store partitioned by day, one flat file per column
+    
+    Layout: <root>/<YYYY-MM-DD>/<computer_id>/timestamp.i64 and <column>.f64.
+    Range scans only read the columns they ask for from the days they overlap,
+    and retention drops whole day directories. A partition is cut back to its
+    complete rows the first time this process appends to it, and again after
+    an append to it failed.
+    """
+    
+    def __init__(self, root, columns):
+        self.root = root
+        self.columns = list(columns)
+        self.lock = threading.Lock()
+        self.aligned = set()  # (day, computer_id) partitions whose files are known to line up
+        os.makedirs(root, exist_ok=True)
+    
+    def partitions(self):
+        """Day partition names, oldest first"""
+        days = []
+        for name in os.listdir(self.root):
+            try:
+                datetime.strptime(name, DAY_FORMAT)
+            except ValueError:
+                continue
+            days.append(name)
+        return sorted(days)
+    
+    def day_start(self, day):
+        """Epoch seconds at which a day partition begins"""
+        return int(datetime.strptime(day, DAY_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+    
+    def align(self, path):
+        """Truncate every file of a partition to the rows its timestamps file completes
+        
+        An append interrupted part-way (a crash, a full disk) leaves some
+        columns longer than the timestamps, and the next append would line
+        its values up against the wrong rows.
+        """
+        timestamp_path = os.path.join(path, TIMESTAMP_FILE)
+        size = os.path.getsize(timestamp_path) // 8 * 8 if os.path.exists(timestamp_path) else 0
+        for name in [TIMESTAMP_FILE] + [f'{column}.f64' for column in self.columns]:
+            file_path = os.path.join(path, name)
+            if os.path.exists(file_path) and os.path.getsize(file_path) > size:
+                os.truncate(file_path, size)
+    
+    def append(self, rows):
+        """Append (computer_id, timestamp, *columns) rows"""
+        groups = {}
+        for row in rows:
+            day = datetime.fromtimestamp(row[1], timezone.utc).strftime(DAY_FORMAT)
+            groups.setdefault((day, row[0]), []).append(row)
+        
+        with self.lock:
+            for (day, computer_id), group in groups.items():
+                path = os.path.join(self.root, day, str(computer_id))
+                os.makedirs(path, exist_ok=True)
+                if (day, computer_id) not in self.aligned:
+                    self.align(path)
+                    self.aligned.add((day, computer_id))
+                
+                values = np.array([row[2:] for row in group], dtype=np.float64)
+                try:
+                    for index, column in enumerate(self.columns):
+                        with open(os.path.join(path, f'{column}.f64'), 'ab') as f:
+                            f.write(values[:, index].tobytes())
+                    
+                    # Timestamps go last: a scan never reads past the shortest file
+                    with open(os.path.join(path, TIMESTAMP_FILE), 'ab') as f:
+                        f.write(np.array([row[1] for row in group], dtype=np.int64).tobytes())
+                except OSError:
+                    self.aligned.discard((day, computer_id))
+                    raise
+    
+    def read_column(self, path, column, start, count):
+        """Read count values of a column file starting at row start"""
+        return np.fromfile(os.path.join(path, f'{column}.f64'), dtype=np.float64,
+                           count=count, offset=start * 8)
+    
+    def scan(self, computer_id, since, until, columns):
+        """Get (timestamps, values) of a computer with since <= timestamp < until
+        
+        values has one row per sample and one column per requested column, and
+        both arrays are ordered by timestamp. until may be None for no bound.
+        """
+        if until is None:
+            until = np.iinfo(np.int64).max
+        
+        timestamp_parts = []
+        value_parts = []
+        
+        for day in self.partitions():
+            day_start = self.day_start(day)
+            if day_start + 86400 <= since or day_start >= until:
+                continue
+            
+            path = os.path.join(self.root, day, str(computer_id))
+            if not os.path.isdir(path):
+                continue
+            
+            timestamps = np.fromfile(os.path.join(path, TIMESTAMP_FILE), dtype=np.int64)
+            if not len(timestamps):
+                continue
+            
+            # Samples normally arrive in order, so the range is one contiguous slice
+            if np.all(timestamps[1:] >= timestamps[:-1]):
+                start, end = np.searchsorted(timestamps, [since, until])
+                if start == end:
+                    continue
+                timestamp_parts.append(timestamps[start:end])
+                value_parts.append(np.column_stack([
+                    self.read_column(path, column, start, end - start) for column in columns
+                ]))
+            else:
+                mask = (timestamps >= since) & (timestamps < until)
+                timestamp_parts.append(timestamps[mask])
+                value_parts.append(np.column_stack([
+                    self.read_column(path, column, 0, len(timestamps))[mask] for column in columns
+                ]))
+        
+        if not timestamp_parts:
+            return np.empty(0, dtype=np.int64), np.empty((0, len(columns)))
+        
+        timestamps = np.concatenate(timestamp_parts)
+        values = np.concatenate(value_parts)
+        if np.any(timestamps[1:] < timestamps[:-1]):
+            order = np.argsort(timestamps, kind='stable')
+            timestamps, values = timestamps[order], values[order]
+        return timestamps, values
+    
+    def latest(self, computer_id):
+        """Get (timestamp, values) of the newest sample of a computer, or None"""
+        for day in reversed(self.partitions()):
+            path = os.path.join(self.root, day, str(computer_id))
+            timestamp_path = os.path.join(path, TIMESTAMP_FILE)
+            if not os.path.exists(timestamp_path):
+                continue
+            
+            count = os.path.getsize(timestamp_path) // 8
+            if count == 0:
+                continue
+            
+            timestamps = np.fromfile(timestamp_path, dtype=np.int64)
+            last = int(np.argmax(timestamps))
+            values = [float(self.read_column(path, column, last, 1)[0]) for column in self.columns]
+            return int(timestamps[last]), values
+        
+        return None
+    
+    def drop_before(self, cutoff):
+        """Delete day partitions that end at or before cutoff and return how many"""
+        dropped = 0
+        with self.lock:
+            for day in self.partitions():
+                if self.day_start(day) + 86400 > cutoff:
+                    break
+                shutil.rmtree(os.path.join(self.root, day))
+                self.aligned = {key for key in self.aligned if key[0] != day}
+                dropped += 1
+        return dropped
+    
+    def delete(self, computer_id):
+        """Delete every sample of a computer"""
+        with self.lock:
+            for day in self.partitions():
+                shutil.rmtree(os.path.join(self.root, day, str(computer_id)), ignore_errors=True)
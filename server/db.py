@@ -0,0 +1,101 @@
+import sqlite3
+import threading
+import queue
+from contextlib import contextmanager
+
+# Database setup
+DB_PATH = 'stats.db'
+
+# Connection pool settings
+POOL_SIZE = 8  # Idle connections kept for request handlers
+BUSY_TIMEOUT = 30  # Seconds a connection waits on a lock held by the writer
+STATEMENT_CACHE_SIZE = 256  # Prepared statements kept per connection
+
+# Per-connection settings; journal_mode=WAL is persistent and set once by init_db
+PRAGMAS = (
+    'PRAGMA synchronous=NORMAL',
+    'PRAGMA temp_store=MEMORY',
+    'PRAGMA cache_size=-16000',
+)
+
+# Idle connections as (path, connection), most recently used first
+pool = queue.LifoQueue(maxsize=POOL_SIZE)
+pool_stats = {'opened': 0, 'reused': 0}
+pool_stats_lock = threading.Lock()
+
+def connect():
+    """Open a database connection with the pragmas every caller relies on"""
+    conn = sqlite3.connect(DB_PATH, timeout=BUSY_TIMEOUT, check_same_thread=False,
+                           cached_statements=STATEMENT_CACHE_SIZE)
+    for pragma in PRAGMAS:
+        conn.execute(pragma)
+    
+    with pool_stats_lock:
+        pool_stats['opened'] += 1
+    return conn
+
+def configure(path):
+    """Point the pool at another database file and close idle connections"""
+    global DB_PATH
+    DB_PATH = path
+    
+    while True:
+        try:
+            _, conn = pool.get_nowait()
+        except queue.Empty:
+            break
+        conn.close()
+
+def checkout():
+    """Take an idle connection from the pool, or open one if none is left"""
+    while True:
+        try:
+            path, conn = pool.get_nowait()
+        except queue.Empty:
+            return connect()
+        
+        if path == DB_PATH:
+            with pool_stats_lock:
+                pool_stats['reused'] += 1
+            return conn
+        conn.close()  # Left over from before configure()
+
+def checkin(conn):
+    """Return a connection to the pool, closing it if the pool is full"""
+    try:
+        pool.put_nowait((DB_PATH, conn))
+    except queue.Full:
+        conn.close()
+
+@contextmanager
+def connection():
+    """Borrow a pooled connection; commits on success and rolls back on error"""
+    conn = checkout()
+    try:
+        yield conn
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        raise
+    finally:
+        checkin(conn)
+
+def query_one(sql, params=()):
+    """Run a read query on a pooled connection and return the first row"""
+    with connection() as conn:
+        return conn.execute(sql, params).fetchone()
+
+def query_all(sql, params=()):
+    """Run a read query on a pooled connection and return every row"""
+    with connection() as conn:
+        return conn.execute(sql, params).fetchall()
+
+def execute(sql, params=()):
+    """Run a write statement in its own transaction and return the affected row count"""
+    with connection() as conn:
+        return conn.execute(sql, params).rowcount
+
+def pool_info():
+    """Summarize pool usage for the collector status endpoint"""
+    with pool_stats_lock:
+        return dict(pool_stats, idle=pool.qsize(), size=POOL_SIZE)
@@ -0,0 +1,41 @@
+import numpy as np
+
+def min_max_indices(values, points):
+    """Indices of the samples to keep when reducing a series to at most points
+    
+    values holds one row per sample (ordered by time) and one column per plotted
+    gauge. Samples are split into equal-count buckets and, for every column, the
+    minimum and maximum of each bucket are kept, so spikes survive however long
+    the window is. The first and last samples are always kept.
+    """
+    count, columns = values.shape
+    if count <= points:
+        return np.arange(count)
+    
+    if columns == 0:
+        return np.unique(np.linspace(0, count - 1, points).astype(np.int64))
+    
+    buckets = max(1, (points - 2) // (2 * columns))
+    bucket_ids = np.arange(count) * buckets // count
+    starts = np.flatnonzero(np.r_[True, bucket_ids[1:] != bucket_ids[:-1]])
+    ends = np.r_[starts[1:], count]
+    
+    keep = [np.array([0, count - 1])]
+    for column in np.nan_to_num(values).T:
+        # Sorting by (bucket, value) puts each bucket's minimum first and maximum last
+        order = np.lexsort((column, bucket_ids))
+        keep += [order[starts], order[ends - 1]]
+    
+    return np.unique(np.concatenate(keep))
+
+def min_max_rows(rows, points, gauges):
+    """Reduce (timestamp, *gauges, *counters) rows to at most points rows
+    
+    Extremes are chosen on the gauge columns; counters ride along with the
+    rows that are kept.
+    """
+    if len(rows) <= points:
+        return rows
+    
+    values = np.array([row[1:1 + gauges] for row in rows], dtype=np.float64).reshape(len(rows), gauges)
+    return [rows[index] for index in min_max_indices(values, points).tolist()]
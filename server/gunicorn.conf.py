@@ -0,0 +1,13 @@
+"""gunicorn settings for the dashboard server: gunicorn -c gunicorn.conf.py wsgi:app"""
+import os
+
+bind = os.environ.get('MONITOR_BIND', '0.0.0.0:8001')
+workers = int(os.environ.get('MONITOR_WORKERS', 4))
+
+# Threaded workers, since every open dashboard keeps a live stream request running
+worker_class = 'gthread'
+threads = int(os.environ.get('MONITOR_THREADS', 16))
+
+# Each worker imports wsgi.py after forking and takes part in the collector
+# election itself; preloading would start it in the master instead
+preload_app = False
@@ -0,0 +1,283 @@
+import os
+import sys
+import threading
+import time
+from collections import Counter as StackCounter
+from contextlib import contextmanager
+
+# Upper bounds in seconds of the default latency histogram buckets
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+# Every metric created, in the order /metrics lists them
+registry = []
+
+def format_value(value):
+    """Format a sample value the way the Prometheus text format expects"""
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer() and abs(value) < 1e15:
+        return str(int(value))
+    return repr(value)
+
+def format_labels(names, values, extra=()):
+    """Render {name="value",...} with quotes, backslashes and newlines escaped"""
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value in zip(pairs, escaped)) + '}'
+
+class Metric:
+    """A named family of samples, one per combination of label values"""
+    
+    kind = 'untyped'
+    
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+    
+    def key(self, labels):
+        """Label values in declaration order"""
+        return tuple(str(labels[name]) for name in self.labels)
+    
+    def remove(self, **labels):
+        """Forget the sample of one label combination, e.g. a removed computer"""
+        with self.lock:
+            self.values.pop(self.key(labels), None)
+    
+    def samples(self):
+        """(suffix, label values, extra labels, value) tuples to expose"""
+        with self.lock:
+            return [('', key, (), value) for key, value in sorted(self.values.items())]
+    
+    def render(self):
+        """Lines of this metric in the Prometheus text format"""
+        lines = [f'# HELP {self.name} {self.help_text}', f'# TYPE {self.name} {self.kind}']
+        for suffix, key, extra, value in self.samples():
+            lines.append(f'{self.name}{suffix}{format_labels(self.labels, key, extra)} {format_value(value)}')
+        return lines
+
+class Counter(Metric):
+    """A total that only goes up"""
+    
+    kind = 'counter'
+    
+    def inc(self, amount=1, **labels):
+        """Add amount to the counter of a label combination"""
+        key = self.key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    """A value that goes up and down, set directly or read when scraped
+    
+    With a callback, the gauge has no labels and its value is whatever the
+    callback returns at scrape time, so nothing has to be kept up to date.
+    """
+    
+    kind = 'gauge'
+    
+    def __init__(self, name, help_text, labels=(), callback=None):
+        super().__init__(name, help_text, labels)
+        self.callback = callback
+    
+    def set(self, value, **labels):
+        """Set the value of a label combination"""
+        with self.lock:
+            self.values[self.key(labels)] = value
+    
+    def samples(self):
+        if self.callback is None:
+            return super().samples()
+        return [('', (), (), self.callback())]
+
+class Histogram(Metric):
+    """Observations counted into cumulative buckets, with their sum and count"""
+    
+    kind = 'histogram'
+    
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value, **labels):
+        """Record one observation"""
+        key = self.key(labels)
+        with self.lock:
+            entry = self.values.get(key)
+            if entry is None:
+                entry = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][index] += 1
+                    break
+            entry[1] += value
+            entry[2] += 1
+    
+    @contextmanager
+    def time(self, **labels):
+        """Observe how long the body of a with block took"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started, **labels)
+    
+    def samples(self):
+        samples = []
+        with self.lock:
+            for key, (counts, total, count) in sorted(self.values.items()):
+                cumulative = 0
+                for bound, bucket_count in zip(self.buckets, counts):
+                    cumulative += bucket_count
+                    samples.append(('_bucket', key, (('le', format_value(float(bound))),), cumulative))
+                samples.append(('_bucket', key, (('le', '+Inf'),), count))
+                samples.append(('_sum', key, (), total))
+                samples.append(('_count', key, (), count))
+        return samples
+
+def render():
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in registry:
+        try:
+            lines += metric.render()
+        except Exception as e:
+            print(f"Error rendering metric {metric.name}: {e}")
+    return '\n'.join(lines) + '\n'
+
+def thread_cpu_clock(thread_id):
+    """CPU seconds used by a thread so far, or None where the OS cannot tell"""
+    try:
+        return time.clock_gettime(time.pthread_getcpuclockid(thread_id))
+    except (AttributeError, OSError):
+        return None
+
+class SamplingProfiler:
+    """Periodically records the Python stack of every thread that is running
+    
+    A background thread wakes every interval and reads each thread's current
+    frame; stacks are aggregated as thread;outer;...;inner strings, which is
+    the collapsed format flame graph tools read. Where per-thread CPU clocks
+    are available (Linux), threads that used no CPU since the previous sample
+    are skipped, so pollers blocked on the network and idle workers do not
+    drown out the code that is actually busy. Nothing runs until start().
+    """
+    
+    def __init__(self, interval, max_stacks):
+        self.interval = interval
+        self.max_stacks = max_stacks
+        self.stacks = StackCounter()
+        self.lock = threading.Lock()
+        self.thread = None
+        self.stop_event = threading.Event()
+        self.cpu_seen = {}
+        self.samples = 0
+        self.dropped = 0
+        self.started_at = None
+        self.stopped_at = None
+    
+    def running(self):
+        """Whether the sampling thread is active"""
+        return self.thread is not None and self.thread.is_alive()
+    
+    def start(self, interval=None):
+        """Discard earlier samples and start sampling"""
+        with self.lock:
+            if self.running():
+                return
+            if interval is not None:
+                self.interval = interval
+            self.stacks.clear()
+            self.cpu_seen.clear()
+            self.samples = 0
+            self.dropped = 0
+            self.started_at = time.time()
+            self.stopped_at = None
+            self.stop_event.clear()
+            self.thread = threading.Thread(target=self.run, name='profiler', daemon=True)
+            self.thread.start()
+    
+    def stop(self):
+        """Stop sampling and keep what was recorded for report()"""
+        with self.lock:
+            thread = self.thread
+            self.stop_event.set()
+        if thread is not None:
+            thread.join()
+        with self.lock:
+            if self.stopped_at is None and self.started_at is not None:
+                self.stopped_at = time.time()
+    
+    def run(self):
+        """Sampling loop of the profiler thread"""
+        own_id = threading.get_ident()
+        while not self.stop_event.wait(self.interval):
+            self.sample(own_id)
+    
+    def sample(self, own_id):
+        """Record the stack of every thread that ran since the previous sample"""
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        stacks = []
+        
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == own_id:
+                continue
+            
+            cpu = thread_cpu_clock(thread_id)
+            if cpu is not None:
+                previous = self.cpu_seen.get(thread_id)
+                self.cpu_seen[thread_id] = cpu
+                if previous is None or cpu <= previous:
+                    continue
+            
+            frames = []
+            while frame is not None:
+                code = frame.f_code
+                frames.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})')
+                frame = frame.f_back
+            frames.append(names.get(thread_id, str(thread_id)))
+            stacks.append(';'.join(reversed(frames)))
+        
+        with self.lock:
+            self.samples += 1
+            for stack in stacks:
+                # Past the cap only stacks seen before are counted
+                if stack in self.stacks or len(self.stacks) < self.max_stacks:
+                    self.stacks[stack] += 1
+                else:
+                    self.dropped += 1
+    
+    def collapsed(self):
+        """Recorded stacks as 'stack count' lines, busiest first"""
+        with self.lock:
+            return ''.join(f'{stack} {count}\n' for stack, count in self.stacks.most_common())
+    
+    def report(self, limit):
+        """Hottest functions by samples spent in them (self) and under them (total)"""
+        own = StackCounter()
+        total = StackCounter()
+        with self.lock:
+            for stack, count in self.stacks.items():
+                frames = stack.split(';')[1:]
+                if not frames:
+                    continue
+                own[frames[-1]] += count
+                for function in set(frames):
+                    total[function] += count
+            stack_samples = sum(self.stacks.values())
+            end = self.stopped_at or time.time()
+            return {
+                'running': self.running(),
+                'interval': self.interval,
+                'duration': round(end - self.started_at, 3) if self.started_at else 0,
+                'samples': self.samples,
+                'stack_samples': stack_samples,
+                'dropped': self.dropped,
+                'self': [{'function': function, 'samples': count} for function, count in own.most_common(limit)],
+                'total': [{'function': function, 'samples': count} for function, count in total.most_common(limit)]
+            }
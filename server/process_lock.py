@@ -0,0 +1,67 @@
+import time
+
+try:
+    import fcntl
+    msvcrt = None
+except ImportError:  # Windows has byte-range locks in msvcrt instead of flock
+    import msvcrt
+    fcntl = None
+
+class ProcessLock:
+    """Exclusive lock on a file, shared by every process on the machine
+    
+    The operating system releases it when the holding process exits, even if
+    it crashes, so a process waiting for the lock can take over. The lock is
+    tied to the open file, so it must be taken after forking, not before.
+    """
+    
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+    
+    def try_lock(self, f):
+        """Lock an open file without waiting; False if another process holds it"""
+        try:
+            if fcntl is not None:
+                fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            else:
+                f.seek(0)
+                msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        except OSError:
+            return False
+        return True
+    
+    def acquire(self, blocking=True, poll_interval=0.5):
+        """Take the lock, waiting for it when blocking; returns whether it is held"""
+        if self.file is not None:
+            return True
+        
+        f = open(self.path, 'a+b')
+        while not self.try_lock(f):
+            if not blocking:
+                f.close()
+                return False
+            time.sleep(poll_interval)
+        
+        self.file = f
+        return True
+    
+    def release(self):
+        """Give the lock up"""
+        if self.file is None:
+            return
+        
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        else:
+            self.file.seek(0)
+            msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+        self.file.close()
+        self.file = None
+    
+    def __enter__(self):
+        self.acquire()
+        return self
+    
+    def __exit__(self, *exc_info):
+        self.release()
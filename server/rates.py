@@ -0,0 +1,41 @@
+import numpy as np
+
+def counter_increases(values, wrap, wrap_zone):
+    """Increase of monotonic counters between consecutive samples
+    
+    values holds one row per sample (ordered by time) and one column per
+    counter. A decrease is a wrap when wrap is given (32-bit counters) and the
+    previous value lay in the top wrap_zone of the range below it; any other
+    decrease is a reset, such as a reboot, after which the counter started
+    again from zero so the new value is the increase. Returns len(values) - 1
+    rows.
+    """
+    previous, current = values[:-1], values[1:]
+    increases = current - previous
+    dropped = increases < 0
+    if wrap is None:
+        return np.where(dropped, current, increases)
+    wrapped = dropped & (previous >= wrap * wrap_zone) & (previous < wrap)
+    return np.where(wrapped, increases + wrap, np.where(dropped, current, increases))
+
+def counter_rates(timestamps, values, wrap, wrap_zone):
+    """Per-second rates of counters between consecutive samples (len(values) - 1 rows)"""
+    seconds = np.diff(timestamps)[:, None]
+    increases = counter_increases(values, wrap, wrap_zone)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        rates = np.where(seconds > 0, increases / seconds, 0.0)
+    return np.nan_to_num(rates)
+
+def rate_rows(rows, wrap, wrap_zone):
+    """Turn (timestamp, *counters) rows into (timestamp, *rates, *counters) rows
+    
+    Each rate covers the time since the previous row, so the first row only
+    serves as the baseline and is dropped.
+    """
+    if len(rows) < 2:
+        return []
+    
+    data = np.array(rows, dtype=np.float64)
+    timestamps = np.array([row[0] for row in rows], dtype=np.int64)
+    rates = counter_rates(timestamps.astype(np.float64), data[:, 1:], wrap, wrap_zone)
+    return list(zip(timestamps[1:].tolist(), *rates.T.tolist(), *data[1:, 1:].T.tolist()))
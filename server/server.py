@@ -1,13 +1,49 @@
-from flask import Flask, render_template, jsonify, request, session, redirect, url_for, flash
+from flask import Flask, Response, render_template, jsonify, request, session, redirect, url_for, flash, g
 import sqlite3
 import requests
 import threading
 import time
 import json
-from datetime import datetime, timedelta
+import queue
+import zlib
+import heapq
+import random
+import csv
+import io
+
+try:
+    import msgpack
+except ImportError:  # The binary wire format is optional; JSON is always available
+    msgpack = None
+
+try:
+    import pyarrow
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # Parquet and Arrow exports are optional; CSV and NDJSON always work
+    pyarrow = None
+
+try:
+    import columnar
+    import downsample
+    import rates
+except ImportError:  # The columnar storage backend, graph downsampling and query-time rates need NumPy
+    columnar = None
+    downsample = None
+    rates = None
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
 import os
-import hashlib
+import hmac
 from functools import wraps
+from werkzeug.exceptions import RequestEntityTooLarge
+
+import auth
+import cache
+import db
+import metrics
+from process_lock import ProcessLock
 
 app = Flask(__name__)
 app.secret_key = 'your-secret-key-change-this-in-production'  # Change this in production!
@@ -16,14 +52,848 @@ app.secret_key = 'your-secret-key-change-this-in-production'  # Change this in p
 DEFAULT_USERNAME = 'admin'
 DEFAULT_PASSWORD = 'admin123'
 
-# Database setup
-DB_PATH = 'stats.db'
+# Collector settings
+COLLECT_INTERVAL = 30  # Default seconds between polls of a computer (computers.poll_interval overrides it)
+POLL_MIN_INTERVAL = 5  # Shortest poll_interval accepted for a computer
+POLL_MAX_INTERVAL = 3600  # Longest poll_interval accepted (clients keep an hour of snapshots)
+POLL_CONCURRENCY = 32  # Maximum number of computers polled at the same time
+POLL_CONNECT_TIMEOUT = 3  # Seconds to wait for a client to accept the connection
+POLL_TIMEOUT = 10  # Seconds to wait for a connected client to answer
+POLL_BACKOFF_MAX = 600  # Longest wait between polls of an unreachable computer
+POLL_JITTER = 0.1  # Fraction of the interval by which each planned poll is randomly shifted
+SCHEDULE_SYNC_INTERVAL = 10  # Seconds between reloads of the computer list by the collector
+POLL_DRIFT_HISTORY = 1000  # Recent poll start delays kept for /api/collector/status
+RAW_SAMPLE_INTERVAL = 5  # Seconds between the snapshots clients take and report
+
+# One pooled HTTP session per monitored computer (keep-alive between sweeps)
+http_sessions = {}
+http_sessions_lock = threading.Lock()
+
+# Wire format negotiated with clients: msgpack when installed, JSON otherwise
+MSGPACK_TYPE = 'application/x-msgpack'
+ACCEPT_HEADER = f'{MSGPACK_TYPE}, application/json;q=0.9' if msgpack else 'application/json'
+
+# Position in each client's snapshot history as (boot_id, seq)
+poll_cursors = {}
+
+# Push ingestion settings
+PUSH_INTERVAL = 30  # Seconds between pushes suggested to clients
+PUSH_STALE_AFTER = 90  # Polling resumes for a pushing computer silent this long
+INGEST_MAX_BYTES = 8 * 1024 * 1024  # Largest (decompressed) push payload accepted
+INGEST_MAX_SAMPLES = 1000  # Most snapshots accepted in one push
+INGEST_HIGH_WATER = 0.8  # Writer queue fill ratio at which pushes are told to back off
+
+# Request bodies are refused before they are read once they exceed the push limit;
+# gzip-compressed pushes are also limited after inflating
+app.config['MAX_CONTENT_LENGTH'] = INGEST_MAX_BYTES
+
+# Numeric fields every snapshot must have, as paths into the snapshot
+SAMPLE_FIELDS = [
+    ('cpu_percent',),
+    ('memory', 'total'), ('memory', 'used'), ('memory', 'percent'),
+    ('disk', 'total'), ('disk', 'used'),
+    ('network', 'bytes_sent'), ('network', 'bytes_recv')
+]
+
+# Numeric fields of a top_processes entry; missing ones default to 0
+PROCESS_FIELDS = ['pid', 'cpu_percent', 'memory_percent', 'create_time']
+
+# time.monotonic() of the last accepted push per computer
+push_last_seen = {}
+
+# Set when computers are added, removed or reconfigured so the collector reloads them
+schedule_changed = threading.Event()
+
+# Process roles: exactly one process polls, writes samples and rolls them up (see wsgi.py)
+LEADER_RETRY_INTERVAL = 5  # Seconds between attempts of a web worker to become the collector
+STREAM_RELAY_INTERVAL = 2  # Seconds between checks for new samples in processes that do not collect
+INGEST_SPOOL_MAX = 10000  # Pushes waiting in ingest_spool at which further pushes are told to back off
+
+# Set in the process running the collector, sample writer and rollup job
+collector_running = threading.Event()
+collector_locks = []
+
+# Sample writer settings
+WRITE_BATCH_SIZE = 500  # Maximum number of queued samples written in one transaction
+WRITE_FLUSH_INTERVAL = 1.0  # Seconds the writer waits to fill a batch
+WRITE_QUEUE_SIZE = 10000  # Pollers block when this many samples are waiting
+PROCESS_CPU_CHANGE = 5.0  # CPU percentage points a process must move to be recorded again
+PROCESS_MEMORY_CHANGE = 1.0  # Memory percentage points a process must move to be recorded again
+PROCESS_EVENT_RETENTION_DAYS = 7  # Process start/change/leave/exit events older than this are pruned
+
+# Rollup and retention settings
+ROLLUP_INTERVAL = 60  # Seconds between rollup job runs
+ROLLUP_LAG = 120  # Recent buckets stay open this long; older ones are reopened when late samples arrive
+ROLLUP_MAX_BUCKETS = 1440  # Buckets a tier may advance per run when catching up
+RAW_RETENTION_DAYS = 7  # Raw samples older than this are pruned once rolled up
+PRUNE_BATCH_SIZE = 5000  # Rows deleted per transaction when pruning
+DEFAULT_GRAPH_POINTS = 1500  # Point budget of the history and graph endpoints
+MAX_GRAPH_POINTS = 5000  # Largest point budget a request may ask for
+DOWNSAMPLE_HEADROOM = 12  # Graphs read up to this many times their budget, then downsample
+
+# Storage backend for samples: 'sqlite' keeps them in the stats and rollup tables,
+# 'columnar' in per-day column files under COLUMNAR_PATH (requires NumPy)
+STORAGE_BACKEND = 'sqlite'
+COLUMNAR_PATH = 'series'
+COLUMNAR_RETENTION_DAYS = 365  # Day partitions older than this are dropped
+
+# Sample columns after computer_id and timestamp, in stats row order
+STATS_COLUMNS = [
+    'cpu_percent', 'memory_total', 'memory_used', 'memory_percent',
+    'disk_total', 'disk_used', 'disk_percent',
+    'network_bytes_sent', 'network_bytes_recv',
+    'network_sent_per_sec', 'network_recv_per_sec'
+]
+
+# Gauges summarised in the rollup tables as <column>_min, <column>_max and <column>_avg
+ROLLUP_METRICS = [
+    'cpu_percent', 'memory_percent', 'disk_percent',
+    'network_sent_per_sec', 'network_recv_per_sec'
+]
+
+# Monotonic counters keep only their latest value per bucket as <column>_max
+ROLLUP_COUNTERS = ['network_bytes_sent', 'network_bytes_recv']
+
+# Network rates are derived on the server from the byte counters. A drop is a
+# reset, e.g. after a reboot, unless the client marks its counters as 32-bit
+# (counter_bits) and the drop is from the top COUNTER_WRAP_ZONE of COUNTER_WRAP
+COUNTER_WRAP = 2 ** 32
+COUNTER_WRAP_ZONE = 0.75
+
+# Labelled series reported by clients as [name, labels, value] under "metrics",
+# stored one row per series and sample in metric_samples. Only names listed here
+# are stored, so a new metric takes one entry; counters are graphed as rates
+METRIC_DESCRIPTORS = {
+    'cpu.core_percent': {'type': 'gauge', 'unit': 'percent', 'description': 'CPU usage per logical core'},
+    'disk.total_bytes': {'type': 'gauge', 'unit': 'bytes', 'description': 'Filesystem size per mountpoint'},
+    'disk.used_bytes': {'type': 'gauge', 'unit': 'bytes', 'description': 'Filesystem usage per mountpoint'},
+    'disk.used_percent': {'type': 'gauge', 'unit': 'percent', 'description': 'Filesystem usage per mountpoint'},
+    'disk.read_bytes': {'type': 'counter', 'unit': 'bytes', 'description': 'Bytes read per disk'},
+    'disk.write_bytes': {'type': 'counter', 'unit': 'bytes', 'description': 'Bytes written per disk'},
+    'disk.reads': {'type': 'counter', 'unit': 'operations', 'description': 'Read operations per disk'},
+    'disk.writes': {'type': 'counter', 'unit': 'operations', 'description': 'Write operations per disk'},
+    'net.bytes_sent': {'type': 'counter', 'unit': 'bytes', 'description': 'Bytes sent per network interface'},
+    'net.bytes_recv': {'type': 'counter', 'unit': 'bytes', 'description': 'Bytes received per network interface'},
+    'net.packets_sent': {'type': 'counter', 'unit': 'packets', 'description': 'Packets sent per network interface'},
+    'net.packets_recv': {'type': 'counter', 'unit': 'packets', 'description': 'Packets received per network interface'},
+    'net.errors': {'type': 'counter', 'unit': 'packets', 'description': 'Receive and send errors per network interface'},
+    'net.drops': {'type': 'counter', 'unit': 'packets', 'description': 'Dropped packets per network interface'},
+    'system.load1': {'type': 'gauge', 'unit': 'processes', 'description': '1 minute load average'},
+    'system.load5': {'type': 'gauge', 'unit': 'processes', 'description': '5 minute load average'},
+    'system.load15': {'type': 'gauge', 'unit': 'processes', 'description': '15 minute load average'}
+}
+METRIC_MAX_SERIES = 1000  # Labelled series kept per snapshot; the rest are dropped
+METRIC_MAX_SERIES_PER_COMPUTER = 2000  # Series a computer may have; new label sets past it are dropped
+METRIC_RETENTION_DAYS = 2  # Labelled series are not rolled up; raw samples older than this are pruned
+PRUNE_SERIES_BATCH = 100  # Labelled series pruned per transaction
+
+# Rollup tiers from finest to coarsest; each tier is built from the one before it
+ROLLUP_TIERS = [
+    {'name': '1m', 'table': 'stats_1m', 'seconds': 60, 'retention_days': 30},
+    {'name': '1h', 'table': 'stats_1h', 'seconds': 3600, 'retention_days': 365},
+    {'name': '1d', 'table': 'stats_1d', 'seconds': 86400, 'retention_days': None}
+]
+
+# Samples handed from the pollers to the sample writer
+sample_queue = queue.Queue(maxsize=WRITE_QUEUE_SIZE)
+
+LATEST_CACHE_SIZE = 10000  # Computers whose newest sample is kept in memory
+PROCESS_MAX_AGE = 5 * 60  # Process lists older than this are not shown
+
+# Bulk export settings
+EXPORT_BATCH_SIZE = 5000  # Rows fetched from the database per chunk of an export
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+    'parquet': 'application/vnd.apache.parquet',
+    'arrow': 'application/vnd.apache.arrow.stream'
+}
+PROCESS_EVENT_COLUMNS = ['computer_id', 'timestamp', 'event', 'pid', 'create_time',
+                         'name', 'cpu_percent', 'memory_percent']
+
+# Fleet aggregate settings
+FLEET_CACHE_TTL = 15  # Seconds fleet-wide aggregates are served from cache
+FLEET_CACHE_SIZE = 256  # Distinct (metric, window) aggregates kept in the cache
+FLEET_ROWS_PER_HOST = 1500  # Aggregates read the finest resolution within this many rows per host
+FLEET_PERCENTILES = [50, 90, 95, 99]  # Percentiles of per-host values in /api/fleet/summary
+FLEET_MAX_TOP = 100  # Largest k accepted by /api/fleet/top
+
+# Authentication settings (password hashing cost is set in auth.py)
+AUTH_CACHE_TTL = 60  # Seconds a checked session, API token or computer token is trusted without the database
+AUTH_CACHE_SIZE = 10000  # Credentials kept in the cache
+
+# Live update stream settings
+STREAM_QUEUE_SIZE = 100  # Events buffered per stream client before it is told to resync
+STREAM_KEEPALIVE = 15  # Seconds between keep-alive comments on an idle stream
+
+# Self-metrics and profiling settings
+METRICS_TOKEN = None  # Bearer token that lets a scraper read /metrics without logging in
+PROFILE_INTERVAL = 0.01  # Seconds between stack samples while the profiler runs
+PROFILE_MAX_STACKS = 20000  # Distinct stacks the profiler keeps before dropping new ones
+PROFILE_TOP = 30  # Functions listed per ranking in the /api/profiler report
+
+class LatestSampleCache:
+    """Newest stats sample and process list per computer, kept in memory
+    
+    The sample writer updates it after each committed batch so the read
+    endpoints can answer without touching the database. Entries are
+    evicted least-recently-updated first once max_size is reached.
+    """
+    
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+    
+    def update(self, computer_id, timestamp, stats, processes, computer_name):
+        """Store the newest sample for a computer"""
+        with self.lock:
+            self.entries[computer_id] = {
+                'timestamp': timestamp,
+                'stats': stats,
+                'processes': processes,
+                'computer_name': computer_name
+            }
+            self.entries.move_to_end(computer_id)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+    
+    def get(self, computer_id):
+        """Get the cached entry for a computer, or None on a miss"""
+        with self.lock:
+            entry = self.entries.get(computer_id)
+            if entry is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+            return entry
+    
+    def evict(self, computer_id):
+        """Forget a computer, e.g. after it was removed"""
+        with self.lock:
+            self.entries.pop(computer_id, None)
+    
+    def info(self):
+        """Size and hit/miss counters for monitoring"""
+        with self.lock:
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'hits': self.hits,
+                'misses': self.misses
+            }
+
+# Newest sample per computer, filled by the sample writer and read by the API
+latest_samples = LatestSampleCache(LATEST_CACHE_SIZE)
+
+# Per-host summaries behind the fleet aggregate endpoints
+fleet_cache = cache.TTLCache(FLEET_CACHE_TTL, FLEET_CACHE_SIZE)
+
+# Results of credential checks, failed ones (None) included, so neither valid nor
+# bogus sessions, API tokens and computer tokens reach the database more than once
+# per AUTH_CACHE_TTL. Entries are cleared when credentials change in this process;
+# other processes see the change once their entries expire
+auth_cache = cache.TTLCache(AUTH_CACHE_TTL, AUTH_CACHE_SIZE)
+
+class EventBroadcaster:
+    """Fan-out of collector updates to every connected /api/stream client
+    
+    Each event is serialised once and queued for all subscribers. A client
+    that falls STREAM_QUEUE_SIZE events behind has its backlog replaced by
+    a single resync event, after which it reloads the full snapshot.
+    """
+    
+    def __init__(self, queue_size):
+        self.queue_size = queue_size
+        self.subscribers = set()
+        self.lock = threading.Lock()
+    
+    def subscribe(self):
+        """Register a new stream client and return its event queue"""
+        subscriber = queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.add(subscriber)
+        return subscriber
+    
+    def unsubscribe(self, subscriber):
+        """Remove a stream client"""
+        with self.lock:
+            self.subscribers.discard(subscriber)
+    
+    def has_subscribers(self):
+        """Whether any stream client is connected"""
+        with self.lock:
+            return bool(self.subscribers)
+    
+    def publish(self, event, data):
+        """Send an event to every connected stream client"""
+        message = f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        
+        with self.lock:
+            subscribers = list(self.subscribers)
+        
+        for subscriber in subscribers:
+            try:
+                subscriber.put_nowait(message)
+            except queue.Full:
+                with subscriber.mutex:
+                    subscriber.queue.clear()
+                subscriber.put_nowait("event: resync\ndata: {}\n\n")
+
+class ProcessTracker:
+    """Current top-process view per computer, diffed against every new sample
+    
+    Processes are identified by (pid, create_time). A process entering the
+    reported list is recorded as a start and one leaving it as a leave, since
+    it may still run below the top of the list; only a process whose pid was
+    taken over by a new one is recorded as an exit. A tracked process only
+    produces a change once its CPU or memory moved by more than the change
+    thresholds since it was last recorded. Steady processes are not written
+    at all. Views are loaded from process_state
+    on first use, so the tracker survives restarts.
+    """
+    
+    def __init__(self):
+        self.views = {}
+    
+    def forget(self, computer_id=None):
+        """Drop the in-memory view of one computer, or of all of them"""
+        if computer_id is None:
+            self.views.clear()
+        else:
+            self.views.pop(computer_id, None)
+    
+    def load(self, cursor, computer_id):
+        """Get the recorded view of a computer, reading it from the database if needed"""
+        view = self.views.get(computer_id)
+        if view is None:
+            cursor.execute('''
+                SELECT pid, create_time, name, cpu_percent, memory_percent
+                FROM process_state
+                WHERE computer_id = ?
+            ''', (computer_id,))
+            view = {(row[0], row[1]): row[2:] for row in cursor.fetchall()}
+            self.views[computer_id] = view
+        return view
+    
+    def diff(self, cursor, computer_id, timestamp, process_rows):
+        """Update the view from a sample's process rows and return the events to store"""
+        view = self.load(cursor, computer_id)
+        events = []
+        seen = set()
+        
+        for _, _, pid, name, cpu_percent, memory_percent, create_time in process_rows:
+            key = (pid, create_time)
+            seen.add(key)
+            recorded = view.get(key)
+            
+            if recorded is None:
+                event = 'start'
+            elif (abs(cpu_percent - recorded[1]) >= PROCESS_CPU_CHANGE or
+                  abs(memory_percent - recorded[2]) >= PROCESS_MEMORY_CHANGE):
+                event = 'change'
+            else:
+                continue
+            
+            view[key] = (name, cpu_percent, memory_percent)
+            events.append((computer_id, timestamp, event, pid, create_time, name, cpu_percent, memory_percent))
+        
+        seen_pids = {pid for pid, _ in seen}
+        for key in [key for key in view if key not in seen]:
+            name, cpu_percent, memory_percent = view.pop(key)
+            event = 'exit' if key[0] in seen_pids else 'leave'
+            events.append((computer_id, timestamp, event, key[0], key[1], name, cpu_percent, memory_percent))
+        
+        return events
+
+# Top-process views, owned by the sample writer thread
+process_tracker = ProcessTracker()
+
+def counter_increase(previous, current, wrap=None):
+    """How far a monotonic counter advanced, allowing for a reset, or a wrap at wrap if given"""
+    if current >= previous:
+        return current - previous
+    if wrap is not None and wrap * COUNTER_WRAP_ZONE <= previous < wrap:
+        return current + wrap - previous
+    return current
+
+def counter_wrap(counter_bits):
+    """Where counters wrap given the counter_bits a client reported, or None if they do not"""
+    return COUNTER_WRAP if counter_bits == 32 else None
+
+class SampleTracker:
+    """Time and network counters of the newest stored sample per computer
+    
+    Poll cursors only live in memory, so after a restart or a collector
+    failover clients send their whole buffer again; samples at or before the
+    newest stored one are dropped rather than written twice. Rates reported
+    by clients depend on when and how often they were asked, so the writer
+    replaces them with the counter increase since the previous stored sample.
+    Baselines are loaded from storage on first use. The first sample of a
+    computer, and the first one after its client restarted (a new boot_id,
+    after which its counters may have started over), keep the rate the
+    client sent and only become the new baseline.
+    """
+    
+    def __init__(self):
+        self.baselines = {}
+    
+    def forget(self, computer_id=None):
+        """Drop the baseline of one computer, or of all of them"""
+        if computer_id is None:
+            self.baselines.clear()
+        else:
+            self.baselines.pop(computer_id, None)
+    
+    def load(self, cursor, computer_id):
+        """Get (timestamp, bytes sent, bytes received, boot_id) of the newest stored sample, or None"""
+        if computer_id not in self.baselines:
+            row = storage.latest(cursor, computer_id)
+            self.baselines[computer_id] = (row[2], row[10], row[11], None) if row else None
+        return self.baselines[computer_id]
+    
+    def apply(self, cursor, sample):
+        """Get the stats row of a sample with network rates derived from the counters, or None if it is not new"""
+        stats_row, boot_id = sample['stats'], sample['boot_id']
+        computer_id, timestamp = stats_row[0], stats_row[1]
+        sent, recv = stats_row[9], stats_row[10]
+        baseline = self.load(cursor, computer_id)
+        
+        if baseline is not None and timestamp <= baseline[0]:
+            return None
+        
+        self.baselines[computer_id] = (timestamp, sent, recv, boot_id)
+        if baseline is None or None in (sent, recv, baseline[1], baseline[2]):
+            return stats_row
+        if boot_id is not None and baseline[3] is not None and boot_id != baseline[3]:
+            return stats_row
+        
+        seconds = timestamp - baseline[0]
+        wrap = counter_wrap(sample['counter_bits'])
+        return stats_row[:11] + (
+            counter_increase(baseline[1], sent, wrap) / seconds,
+            counter_increase(baseline[2], recv, wrap) / seconds
+        )
+
+# Newest stored sample per computer, owned by the sample writer thread
+sample_tracker = SampleTracker()
+
+class SeriesRegistry:
+    """Ids of the labelled series of every computer, created when first reported
+    
+    A computer's series are loaded from metric_series on first use. Once it
+    has METRIC_MAX_SERIES_PER_COMPUTER of them, new label sets are dropped,
+    so a client inventing label values cannot grow the table without bound.
+    Series whose samples have all been pruned are deleted by delete_empty
+    so that label churn (container NICs, transient mounts) frees its slots.
+    """
+    
+    def __init__(self):
+        self.ids = {}  # computer_id -> {(name, labels): series_id}
+    
+    def forget(self, computer_id=None):
+        """Drop the cached ids of one computer, or everything"""
+        if computer_id is None:
+            self.ids.clear()
+        else:
+            self.ids.pop(computer_id, None)
+    
+    def load(self, cursor, computer_id):
+        """Get the series ids of a computer, reading them from the database if needed"""
+        series = self.ids.get(computer_id)
+        if series is None:
+            cursor.execute('SELECT name, labels, id FROM metric_series WHERE computer_id = ?', (computer_id,))
+            series = {(name, labels): series_id for name, labels, series_id in cursor.fetchall()}
+            self.ids[computer_id] = series
+        return series
+    
+    def resolve(self, cursor, computer_id, name, labels):
+        """Get the id of a series, creating it in the open transaction; None once at the cap"""
+        series = self.load(cursor, computer_id)
+        series_id = series.get((name, labels))
+        if series_id is None:
+            if len(series) >= METRIC_MAX_SERIES_PER_COMPUTER:
+                return None
+            cursor.execute('INSERT INTO metric_series (computer_id, name, labels) VALUES (?, ?, ?)',
+                           (computer_id, name, labels))
+            series_id = cursor.lastrowid
+            series[(name, labels)] = series_id
+        return series_id
+    
+    def delete_empty(self, cursor):
+        """Delete series without samples in the open transaction and drop their cached ids"""
+        cursor.execute('''
+            SELECT DISTINCT computer_id FROM metric_series
+            WHERE NOT EXISTS (SELECT 1 FROM metric_samples WHERE series_id = metric_series.id)
+        ''')
+        computer_ids = [row[0] for row in cursor.fetchall()]
+        cursor.execute('''
+            DELETE FROM metric_series
+            WHERE NOT EXISTS (SELECT 1 FROM metric_samples WHERE series_id = metric_series.id)
+        ''')
+        for computer_id in computer_ids:
+            self.forget(computer_id)
+        return cursor.rowcount
+
+# Labelled series ids, owned by the sample writer thread
+series_registry = SeriesRegistry()
+
+# Single producer for the live update stream, fed by the sample writer
+broadcaster = EventBroadcaster(STREAM_QUEUE_SIZE)
+
+# Computer names by id, refreshed by the collector on every sweep
+computer_names = {}
+
+def database_size():
+    """Bytes used by the SQLite database, including its write-ahead log"""
+    return sum(os.path.getsize(path) for path in (db.DB_PATH, db.DB_PATH + '-wal')
+               if os.path.exists(path))
+
+# Server self-metrics, exposed in the Prometheus text format on /metrics
+POLL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+poll_seconds = metrics.Histogram('monitor_poll_seconds', 'Time to fetch and parse the samples of one computer',
+                                 ['computer_id'], POLL_BUCKETS)
+poll_total = metrics.Counter('monitor_polls_total', 'Polls of computers by outcome', ['outcome'])
+poll_delay_seconds = metrics.Histogram('monitor_poll_delay_seconds', 'How late polls started compared with their plan',
+                                       buckets=POLL_BUCKETS)
+ingested_samples = metrics.Counter('monitor_ingested_samples_total', 'Samples queued for writing by source', ['source'])
+write_batch_seconds = metrics.Histogram('monitor_write_batch_seconds', 'Time to write one batch of queued samples')
+written_samples = metrics.Counter('monitor_written_samples_total', 'Samples committed by the sample writer')
+write_errors = metrics.Counter('monitor_write_errors_total', 'Sample batches that failed and were rolled back')
+prune_seconds = metrics.Histogram('monitor_prune_seconds', 'Time to prune expired rows from a table', ['table'])
+pruned_rows = metrics.Counter('monitor_pruned_rows_total', 'Rows deleted by retention', ['table'])
+maintenance_seconds = metrics.Histogram('monitor_maintenance_seconds', 'Time of one rollup and retention run',
+                                        buckets=metrics.LATENCY_BUCKETS + (30, 60, 300))
+request_seconds = metrics.Histogram('monitor_http_request_seconds',
+                                    'Time to build the response of a request, by route, method and status',
+                                    ['route', 'method', 'status'])
+metrics.Gauge('monitor_write_queue_samples', 'Samples waiting for the sample writer', callback=lambda: sample_queue.qsize())
+metrics.Gauge('monitor_database_bytes', 'Size of the SQLite database and its write-ahead log', callback=database_size)
+metrics.Gauge('monitor_computers', 'Computers in the poll schedule', callback=lambda: len(poll_scheduler.hosts))
+metrics.Gauge('monitor_computers_backing_off', 'Computers polled less often after failed polls',
+              callback=lambda: poll_scheduler.info(time.monotonic())['backing_off'])
+metrics.Gauge('monitor_stream_subscribers', 'Connected live update streams',
+              callback=lambda: len(broadcaster.subscribers))
+
+# Opt-in stack sampler, started and stopped through /api/profiler
+profiler = metrics.SamplingProfiler(PROFILE_INTERVAL, PROFILE_MAX_STACKS)
+
+def migrate_epoch_timestamps(cursor):
+    """Schema v1: integer epoch timestamps and (computer_id, timestamp) indexes"""
+    # Original processes table, so new databases go through the same rebuild
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS processes (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            computer_id INTEGER,
+            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            pid INTEGER,
+            name TEXT,
+            cpu_percent REAL,
+            memory_percent REAL,
+            create_time REAL,
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+    ''')
+    
+    # SQLite cannot change a column type in place, so both tables are rebuilt
+    cursor.execute('DROP TABLE IF EXISTS stats_v1')
+    cursor.execute('DROP TABLE IF EXISTS processes_v1')
+    cursor.execute('''
+        CREATE TABLE stats_v1 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            computer_id INTEGER,
+            timestamp INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            cpu_percent REAL,
+            memory_total INTEGER,
+            memory_used INTEGER,
+            memory_percent REAL,
+            disk_total INTEGER,
+            disk_used INTEGER,
+            disk_percent REAL,
+            network_bytes_sent INTEGER,
+            network_bytes_recv INTEGER,
+            network_sent_per_sec REAL DEFAULT 0,
+            network_recv_per_sec REAL DEFAULT 0,
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO stats_v1
+        SELECT id, computer_id, CAST(strftime('%s', timestamp) AS INTEGER),
+               cpu_percent, memory_total, memory_used, memory_percent,
+               disk_total, disk_used, disk_percent,
+               network_bytes_sent, network_bytes_recv,
+               network_sent_per_sec, network_recv_per_sec
+        FROM stats
+        WHERE timestamp IS NOT NULL
+    ''')
+    cursor.execute('DROP TABLE stats')
+    cursor.execute('ALTER TABLE stats_v1 RENAME TO stats')
+    
+    cursor.execute('''
+        CREATE TABLE processes_v1 (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            computer_id INTEGER,
+            timestamp INTEGER NOT NULL DEFAULT (CAST(strftime('%s', 'now') AS INTEGER)),
+            pid INTEGER,
+            name TEXT,
+            cpu_percent REAL,
+            memory_percent REAL,
+            create_time REAL,
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+    ''')
+    cursor.execute('''
+        INSERT INTO processes_v1
+        SELECT id, computer_id, CAST(strftime('%s', timestamp) AS INTEGER),
+               pid, name, cpu_percent, memory_percent, create_time
+        FROM processes
+        WHERE timestamp IS NOT NULL
+    ''')
+    cursor.execute('DROP TABLE processes')
+    cursor.execute('ALTER TABLE processes_v1 RENAME TO processes')
+    
+    # Covers the history, CPU graph and network graph queries without touching the table
+    cursor.execute('''
+        CREATE INDEX idx_stats_computer_time ON stats (
+            computer_id, timestamp,
+            cpu_percent, memory_percent, disk_percent,
+            network_sent_per_sec, network_recv_per_sec,
+            network_bytes_sent, network_bytes_recv
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX idx_processes_computer_time ON processes (
+            computer_id, timestamp, cpu_percent
+        )
+    ''')
+
+def rollup_column_names():
+    """Names of the summary columns stored in every rollup table"""
+    columns = [f'{metric}_{kind}' for metric in ROLLUP_METRICS for kind in ('min', 'max', 'avg')]
+    columns += [f'{counter}_max' for counter in ROLLUP_COUNTERS]
+    return columns
+
+def migrate_rollup_tables(cursor):
+    """Schema v2: 1-minute, 1-hour and 1-day rollup tables"""
+    column_defs = ',\n'.join(f'            {column} REAL' for column in rollup_column_names())
+    
+    for tier in ROLLUP_TIERS:
+        cursor.execute(f'''
+            CREATE TABLE IF NOT EXISTS {tier['table']} (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                computer_id INTEGER NOT NULL,
+                bucket INTEGER NOT NULL,
+                samples INTEGER NOT NULL,
+{column_defs},
+                UNIQUE (computer_id, bucket),
+                FOREIGN KEY (computer_id) REFERENCES computers (id)
+            )
+        ''')
+        cursor.execute(f'''
+            CREATE INDEX IF NOT EXISTS idx_{tier['table']}_bucket ON {tier['table']} (bucket)
+        ''')
+    
+    # How far each tier has been rolled up (epoch seconds, exclusive)
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS rollup_state (
+            tier TEXT PRIMARY KEY,
+            rolled_until INTEGER NOT NULL
+        )
+    ''')
+    
+    # Rollups and retention scan raw samples by time across all computers
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_stats_timestamp ON stats (timestamp)')
+
+def migrate_process_events(cursor):
+    """Schema v3: delta-encoded process events and a current process view"""
+    # Full top-20 snapshots per poll are replaced by start/exit/change events
+    cursor.execute('DROP TABLE IF EXISTS processes')
+    
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS process_events (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            computer_id INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            event TEXT NOT NULL,
+            pid INTEGER,
+            create_time REAL,
+            name TEXT,
+            cpu_percent REAL,
+            memory_percent REAL,
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+    ''')
+    cursor.execute('''
+        CREATE INDEX IF NOT EXISTS idx_process_events_computer_time
+        ON process_events (computer_id, timestamp)
+    ''')
+    cursor.execute('CREATE INDEX IF NOT EXISTS idx_process_events_timestamp ON process_events (timestamp)')
+    
+    # Current top processes per computer, maintained from the events
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS process_state (
+            computer_id INTEGER NOT NULL,
+            pid INTEGER NOT NULL,
+            create_time REAL NOT NULL,
+            name TEXT,
+            cpu_percent REAL,
+            memory_percent REAL,
+            PRIMARY KEY (computer_id, pid, create_time)
+        ) WITHOUT ROWID
+    ''')
+    
+    # Time of the newest process list per computer, for freshness checks
+    try:
+        cursor.execute('ALTER TABLE computers ADD COLUMN processes_at INTEGER')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+
+def migrate_poll_intervals(cursor):
+    """Schema v4: optional per-computer polling interval"""
+    try:
+        cursor.execute('ALTER TABLE computers ADD COLUMN poll_interval INTEGER')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+
+def migrate_ingest_spool(cursor):
+    """Schema v5: pushes received by web workers, waiting for the collector process"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS ingest_spool (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            computer_id INTEGER NOT NULL,
+            boot_id TEXT,
+            samples TEXT NOT NULL
+        )
+    ''')
+
+def migrate_api_tokens(cursor):
+    """Schema v6: API tokens for scripts and a per-user session version"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS api_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            token_hash TEXT UNIQUE NOT NULL,
+            created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id)
+        )
+    ''')
+    
+    # Bumped on password changes to sign out every existing session
+    try:
+        cursor.execute('ALTER TABLE users ADD COLUMN session_version INTEGER DEFAULT 0')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+
+def migrate_metric_series(cursor):
+    """Schema v7: labelled series in a long-format table, described by a metric registry"""
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metric_descriptors (
+            name TEXT PRIMARY KEY,
+            type TEXT NOT NULL DEFAULT 'gauge',
+            unit TEXT NOT NULL DEFAULT '',
+            description TEXT NOT NULL DEFAULT ''
+        )
+    ''')
+    
+    # One row per (computer, metric, label set); labels are canonical JSON
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metric_series (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            computer_id INTEGER NOT NULL,
+            name TEXT NOT NULL,
+            labels TEXT NOT NULL DEFAULT '{}',
+            UNIQUE (computer_id, name, labels),
+            FOREIGN KEY (computer_id) REFERENCES computers (id)
+        )
+    ''')
+    
+    # Clustered by (series, time), so a graph reads one contiguous range
+    cursor.execute('''
+        CREATE TABLE IF NOT EXISTS metric_samples (
+            series_id INTEGER NOT NULL,
+            timestamp INTEGER NOT NULL,
+            value REAL,
+            PRIMARY KEY (series_id, timestamp)
+        ) WITHOUT ROWID
+    ''')
+
+def migrate_counter_bits(cursor):
+    """Schema v8: counter width reported by each computer's client"""
+    try:
+        cursor.execute('ALTER TABLE computers ADD COLUMN counter_bits INTEGER')
+    except sqlite3.OperationalError:
+        pass  # Column already exists
+
+# Schema migrations as (version, function), applied in order by migrate_db
+MIGRATIONS = [
+    (1, migrate_epoch_timestamps),
+    (2, migrate_rollup_tables),
+    (3, migrate_process_events),
+    (4, migrate_poll_intervals),
+    (5, migrate_ingest_spool),
+    (6, migrate_api_tokens),
+    (7, migrate_metric_series),
+    (8, migrate_counter_bits),
+]
+
+def migrate_db(cursor):
+    """Bring the database schema up to the newest version"""
+    version = cursor.execute('PRAGMA user_version').fetchone()[0]
+    
+    for target_version, migration in MIGRATIONS:
+        if version < target_version:
+            print(f"Migrating database schema to version {target_version}...")
+            migration(cursor)
+            cursor.execute(f'PRAGMA user_version = {target_version}')
+            version = target_version
+
+def format_timestamp(timestamp):
+    """Format an epoch timestamp from the database as an ISO 8601 UTC string"""
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat()
+
+def stats_row_to_dict(row):
+    """Convert a full stats table row into the JSON shape used by the API"""
+    return {
+        'timestamp': format_timestamp(row[2]),
+        'cpu_percent': row[3],
+        'memory_total': row[4],
+        'memory_used': row[5],
+        'memory_percent': row[6],
+        'disk_total': row[7],
+        'disk_used': row[8],
+        'disk_percent': row[9],
+        'network_bytes_sent': row[10],
+        'network_bytes_recv': row[11],
+        'network_sent_per_sec': row[12] if len(row) > 12 else 0,
+        'network_recv_per_sec': row[13] if len(row) > 13 else 0
+    }
+
+def process_row_to_dict(row):
+    """Convert a (pid, name, cpu_percent, memory_percent, create_time) row for the API"""
+    # Calculate uptime from create_time
+    uptime_seconds = time.time() - row[4] if row[4] else 0
+    uptime_hours = uptime_seconds / 3600
+    
+    return {
+        'pid': row[0],
+        'name': row[1],
+        'cpu_percent': round(row[2], 1),
+        'memory_percent': round(row[3], 2),
+        'uptime_hours': round(uptime_hours, 1)
+    }
 
 def init_db():
     """Initialize the database with required tables"""
-    conn = sqlite3.connect(DB_PATH)
+    conn = db.connect()
     cursor = conn.cursor()
     
+    # WAL lets the dashboard read while the sample writer commits
+    cursor.execute('PRAGMA journal_mode=WAL')
+    
     # Create users table
     cursor.execute('''
         CREATE TABLE IF NOT EXISTS users (
@@ -78,27 +948,28 @@ def init_db():
     except sqlite3.OperationalError:
         pass  # Column already exists
     
-    # Create processes table
-    cursor.execute('''
-        CREATE TABLE IF NOT EXISTS processes (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            computer_id INTEGER,
-            timestamp TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-            pid INTEGER,
-            name TEXT,
-            cpu_percent REAL,
-            memory_percent REAL,
-            create_time REAL,
-            FOREIGN KEY (computer_id) REFERENCES computers (id)
-        )
-    ''')
+    # Apply versioned schema migrations
+    migrate_db(cursor)
+    
+    # Keep the registry in step with METRIC_DESCRIPTORS
+    cursor.execute(f'''
+        DELETE FROM metric_descriptors
+        WHERE name NOT IN ({', '.join('?' * len(METRIC_DESCRIPTORS))})
+    ''', list(METRIC_DESCRIPTORS))
+    cursor.executemany('''
+        INSERT INTO metric_descriptors (name, type, unit, description)
+        VALUES (?, ?, ?, ?)
+        ON CONFLICT (name) DO UPDATE SET type = excluded.type, unit = excluded.unit,
+                                         description = excluded.description
+    ''', [(name, descriptor['type'], descriptor['unit'], descriptor['description'])
+          for name, descriptor in METRIC_DESCRIPTORS.items()])
     
     # Create default admin user if no users exist
     cursor.execute('SELECT COUNT(*) FROM users')
     user_count = cursor.fetchone()[0]
     
     if user_count == 0:
-        password_hash = hashlib.sha256(DEFAULT_PASSWORD.encode()).hexdigest()
+        password_hash = auth.hash_password(DEFAULT_PASSWORD)
         cursor.execute('''
             INSERT INTO users (username, password_hash)
             VALUES (?, ?)
@@ -110,157 +981,1191 @@ def init_db():
     conn.close()
 
 def authenticate_user(username, password):
-    """Authenticate user credentials"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    """Check user credentials and return (user_id, session_version), or None"""
+    user = db.query_one('''
+        SELECT id, password_hash, session_version FROM users
+        WHERE username = ?
+    ''', (username,))
     
-    password_hash = hashlib.sha256(password.encode()).hexdigest()
-    cursor.execute('''
-        SELECT id FROM users 
-        WHERE username = ? AND password_hash = ?
-    ''', (username, password_hash))
+    if user is None or not auth.verify_password(password, user[1]):
+        return None
     
-    user = cursor.fetchone()
-    conn.close()
+    # Legacy SHA-256 hashes and outdated scrypt costs are upgraded on login
+    if auth.needs_rehash(user[1]):
+        db.execute('UPDATE users SET password_hash = ? WHERE id = ?', (auth.hash_password(password), user[0]))
     
-    return user is not None
+    return user[0], user[2] or 0
+
+def session_user():
+    """Get the user id of the logged-in session, or None
+    
+    Sessions carry the user's session_version from login time; a password
+    change bumps it, which signs out every session issued before.
+    """
+    user_id = session.get('user_id')
+    if not session.get('logged_in') or user_id is None:
+        return None
+    
+    key = ('session', user_id)
+    version = auth_cache.get(key)
+    if version is cache.MISS:
+        row = db.query_one('SELECT session_version FROM users WHERE id = ?', (user_id,))
+        version = (row[0] or 0) if row else None
+        auth_cache.put(key, version)
+    
+    return user_id if version is not None and version == session.get('session_version') else None
+
+def token_user(token):
+    """Get the user id owning an API token, or None"""
+    key = ('token', auth.token_digest(token))
+    user_id = auth_cache.get(key)
+    if user_id is cache.MISS:
+        row = db.query_one('SELECT user_id FROM api_tokens WHERE token_hash = ?', (key[1],))
+        user_id = row[0] if row else None
+        auth_cache.put(key, user_id)
+    return user_id
 
 def login_required(f):
-    """Decorator to require login for routes"""
+    """Decorator to require a logged-in session, or an API token for /api/ routes"""
     @wraps(f)
     def decorated_function(*args, **kwargs):
-        if 'logged_in' not in session or not session['logged_in']:
+        auth_header = request.headers.get('Authorization', '')
+        if auth_header.startswith('Bearer ') and request.path.startswith('/api/'):
+            if token_user(auth_header[len('Bearer '):]) is None:
+                return jsonify({'error': 'Unauthorized'}), 401
+            return f(*args, **kwargs)
+        
+        if session_user() is None:
             return redirect(url_for('login'))
         return f(*args, **kwargs)
     return decorated_function
 
-def add_computer(name, url, token):
-    """Add a new computer to monitor"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+def session_required(f):
+    """Decorator to require a logged-in session; API tokens are refused
     
+    Used where a leaked token must not be able to extend its own reach,
+    such as creating and revoking API tokens.
+    """
+    @wraps(f)
+    def decorated_function(*args, **kwargs):
+        if session_user() is None:
+            return jsonify({'error': 'A logged-in session is required'}), 401
+        return f(*args, **kwargs)
+    return decorated_function
+
+def add_computer(name, url, token, poll_interval=None):
+    """Add a new computer to monitor"""
     try:
-        cursor.execute('''
-            INSERT OR REPLACE INTO computers (name, url, token, last_seen, status)
-            VALUES (?, ?, ?, ?, ?)
-        ''', (name, url, token, datetime.now(), 'offline'))
-        conn.commit()
+        db.execute('''
+            INSERT OR REPLACE INTO computers (name, url, token, last_seen, status, poll_interval)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', (name, url, token, datetime.now(), 'offline', poll_interval))
         return True
     except Exception as e:
         print(f"Error adding computer: {e}")
         return False
-    finally:
-        conn.close()
+
+def get_computer_name(computer_id):
+    """Look up the display name of a computer"""
+    row = db.query_one('SELECT name FROM computers WHERE id = ?', (computer_id,))
+    return row[0] if row else 'Unknown'
+
+def get_http_session(computer_id):
+    """Get the pooled HTTP session for a computer, creating it if needed"""
+    with http_sessions_lock:
+        http_session = http_sessions.get(computer_id)
+        if http_session is None:
+            http_session = requests.Session()
+            http_sessions[computer_id] = http_session
+        return http_session
+
+def drop_http_session(computer_id):
+    """Close and forget the pooled HTTP session for a computer"""
+    with http_sessions_lock:
+        http_session = http_sessions.pop(computer_id, None)
+    if http_session is not None:
+        http_session.close()
+
+def labels_key(labels):
+    """Canonical JSON of a label set, as stored in metric_series"""
+    return json.dumps({str(key): str(value) for key, value in labels.items()},
+                      sort_keys=True, separators=(',', ':'))
+
+def parse_metrics(entries):
+    """Turn reported [name, labels, value] entries into (name, labels key, value) rows
+    
+    Malformed entries and names missing from METRIC_DESCRIPTORS are skipped
+    rather than failing the whole sample.
+    """
+    rows = []
+    for entry in entries[:METRIC_MAX_SERIES]:
+        try:
+            name, labels, value = entry
+            if not isinstance(name, str) or name not in METRIC_DESCRIPTORS or not isinstance(labels, dict):
+                continue
+            rows.append((name, labels_key(labels), float(value)))
+        except (TypeError, ValueError):
+            continue
+    return rows
+
+def is_number(value):
+    """Whether a decoded value is an int or float (bools excluded)"""
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+def check_sample(data):
+    """Raise ValueError unless a pushed or polled snapshot has the shape parse_sample expects"""
+    if not isinstance(data, dict):
+        raise ValueError('sample is not an object')
+    
+    for path in SAMPLE_FIELDS:
+        value = data
+        for key in path:
+            value = value.get(key) if isinstance(value, dict) else None
+        if not is_number(value):
+            raise ValueError(f"{'.'.join(path)} is missing or not a number")
+    
+    disk = data['disk']
+    if 'percent' in disk and not is_number(disk['percent']):
+        raise ValueError('disk.percent is not a number')
+    if 'percent' not in disk and not disk['total']:
+        raise ValueError('disk.percent is missing and disk.total is 0')
+    if data.get('timestamp') is not None and not is_number(data['timestamp']):
+        raise ValueError('timestamp is not a number')
+    
+    usage = data.get('network_usage', {})
+    if not isinstance(usage, dict) or not all(is_number(value) for value in usage.values()):
+        raise ValueError('network_usage is not an object of numbers')
+    processes = data.get('top_processes') or []
+    if not isinstance(processes, list) or not all(isinstance(proc, dict) for proc in processes):
+        raise ValueError('top_processes is not a list of objects')
+    for proc in processes:
+        for field in PROCESS_FIELDS:
+            if field in proc and not is_number(proc[field]):
+                raise ValueError(f'top_processes.{field} is not a number')
+        if 'name' in proc and not isinstance(proc['name'], str):
+            raise ValueError('top_processes.name is not a string')
+    if not isinstance(data.get('metrics') or [], list):
+        raise ValueError('metrics is not a list')
+    if data.get('counter_bits') not in (None, 32, 64):
+        raise ValueError('counter_bits is not 32 or 64')
+
+def parse_sample(computer_id, data, boot_id=None):
+    """Turn a /systeminfo payload of a client run (boot_id) into the rows stored for one sample"""
+    # Get network usage rates if available
+    network_sent_per_sec = data.get('network_usage', {}).get('bytes_sent_per_sec', 0)
+    network_recv_per_sec = data.get('network_usage', {}).get('bytes_recv_per_sec', 0)
+    
+    # Snapshots taken by the client carry their own time
+    timestamp = int(data.get('timestamp') or time.time())
+    
+    stats_row = (
+        computer_id,
+        timestamp,
+        data['cpu_percent'],
+        data['memory']['total'],
+        data['memory']['used'],
+        data['memory']['percent'],
+        data['disk']['total'],
+        data['disk']['used'],
+        data['disk']['percent'] if 'percent' in data['disk'] else (data['disk']['used'] / data['disk']['total'] * 100),
+        data['network']['bytes_sent'],
+        data['network']['bytes_recv'],
+        network_sent_per_sec,
+        network_recv_per_sec
+    )
+    
+    process_rows = [
+        (
+            computer_id,
+            timestamp,
+            proc.get('pid', 0),
+            proc.get('name', 'Unknown'),
+            proc.get('cpu_percent', 0),
+            proc.get('memory_percent', 0),
+            proc.get('create_time', 0)
+        )
+        for proc in data.get('top_processes') or []
+    ]
+    
+    return {
+        'kind': 'sample',
+        'computer_id': computer_id,
+        'stats': stats_row,
+        'processes': process_rows,
+        'series': parse_metrics(data.get('metrics') or []),
+        'boot_id': boot_id,
+        'counter_bits': data.get('counter_bits'),
+        'seen_at': datetime.now()
+    }
+
+def decode_payload(body, content_type):
+    """Decode a msgpack or JSON body according to its content type"""
+    if content_type.split(';')[0].strip() == MSGPACK_TYPE:
+        if msgpack is None:
+            raise ValueError('msgpack payload received but msgpack is not installed')
+        return msgpack.unpackb(body)
+    return json.loads(body)
+
+def decode_response(response):
+    """Decode a client response in whichever format it chose"""
+    return decode_payload(response.content, response.headers.get('Content-Type', ''))
+
+def fetch_samples(computer_id, url, headers, http_session):
+    """Fetch (boot_id, snapshots) a client took since the previous poll, oldest first"""
+    boot_id, seq = poll_cursors.get(computer_id, (None, 0))
+    
+    response = http_session.get(f"{url}/systeminfo/since", params={'seq': seq},
+                                headers=headers, timeout=(POLL_CONNECT_TIMEOUT, POLL_TIMEOUT))
+    if response.status_code == 404:
+        # Older clients only expose their current snapshot
+        response = http_session.get(f"{url}/systeminfo", headers=headers, timeout=(POLL_CONNECT_TIMEOUT, POLL_TIMEOUT))
+        response.raise_for_status()
+        return None, [decode_response(response)]
+    response.raise_for_status()
+    data = decode_response(response)
+    
+    if seq and data['boot_id'] != boot_id:
+        # The client restarted and its sequence numbers started over
+        response = http_session.get(f"{url}/systeminfo/since", params={'seq': 0},
+                                    headers=headers, timeout=(POLL_CONNECT_TIMEOUT, POLL_TIMEOUT))
+        response.raise_for_status()
+        data = decode_response(response)
+    
+    poll_cursors[computer_id] = (data['boot_id'], data['latest_seq'])
+    return data['boot_id'], data['samples']
 
 def fetch_stats_from_computer(computer_id, url, token):
-    """Fetch stats from a single computer"""
+    """Fetch stats from a single computer and queue them for the sample writer"""
+    started = time.perf_counter()
     try:
-        headers = {'Authorization': f'Bearer {token}'}
-        response = requests.get(f"{url}/systeminfo", headers=headers, timeout=10)
-        response.raise_for_status()
+        headers = {'Authorization': f'Bearer {token}', 'Accept': ACCEPT_HEADER}
+        http_session = get_http_session(computer_id)
+        
+        boot_id, snapshots = fetch_samples(computer_id, url, headers, http_session)
+        for data in snapshots:
+            check_sample(data)
+        samples = [parse_sample(computer_id, data, boot_id) for data in snapshots]
+        poll_seconds.observe(time.perf_counter() - started, computer_id=computer_id)
+        poll_total.inc(outcome='success')
+        ingested_samples.inc(len(samples), source='poll')
+        
+        for sample in samples:
+            sample_queue.put(sample)
         
-        data = response.json()
+        return True
+        
+    except Exception as e:
+        print(f"Error fetching stats from computer {computer_id}: {e}")
+        poll_seconds.observe(time.perf_counter() - started, computer_id=computer_id)
+        poll_total.inc(outcome='failure')
         
-        # Store stats in database
-        conn = sqlite3.connect(DB_PATH)
+        # Mark computer as offline in the next batch
+        sample_queue.put({'kind': 'offline', 'computer_id': computer_id})
+        
+        return False
+
+def write_batch(conn, batch):
+    """Write a batch of queued samples in a single transaction"""
+    samples = [item for item in batch if item['kind'] == 'sample']
+    offline_ids = [(item['computer_id'],) for item in batch if item['kind'] == 'offline']
+    prune_series = any(item['kind'] == 'prune_series' for item in batch)
+    
+    online_rows = [(sample['seen_at'], sample['computer_id']) for sample in samples]
+    
+    with conn:
         cursor = conn.cursor()
         
-        # Get network usage rates if available
-        network_sent_per_sec = data.get('network_usage', {}).get('bytes_sent_per_sec', 0)
-        network_recv_per_sec = data.get('network_usage', {}).get('bytes_recv_per_sec', 0)
+        # Requested by maintenance once old series samples are pruned; done here,
+        # before any series is resolved, so no sample is written to a deleted series
+        if prune_series:
+            pruned_rows.inc(series_registry.delete_empty(cursor), table='metric_series')
+        
+        # Samples delivered again (e.g. re-fetched after a restart) only refresh last_seen
+        for sample in samples:
+            sample['stats'] = sample_tracker.apply(cursor, sample)
+        samples = [sample for sample in samples if sample['stats'] is not None]
+        
+        # Graphs read the counter width back when they compute rates
+        cursor.executemany('''
+            UPDATE computers SET counter_bits = ?
+            WHERE id = ? AND counter_bits IS NOT ?
+        ''', {(sample['counter_bits'], sample['computer_id'], sample['counter_bits'])
+              for sample in samples if sample['counter_bits'] is not None})
+        
+        storage.append(cursor, [sample['stats'] for sample in samples])
+        
+        # Labelled series go to the long-format table, one row per series and sample
+        series_rows = []
+        for sample in samples:
+            for name, labels, value in sample['series']:
+                series_id = series_registry.resolve(cursor, sample['computer_id'], name, labels)
+                if series_id is not None:
+                    series_rows.append((series_id, sample['stats'][1], value))
+        cursor.executemany('''
+            INSERT OR REPLACE INTO metric_samples (series_id, timestamp, value)
+            VALUES (?, ?, ?)
+        ''', series_rows)
         
+        # Only processes that entered or left the list, exited or changed noticeably are written
+        process_events = []
+        process_times = []
+        for sample in samples:
+            if sample['processes']:
+                timestamp = sample['stats'][1]
+                process_events += process_tracker.diff(cursor, sample['computer_id'], timestamp, sample['processes'])
+                process_times.append((timestamp, sample['computer_id']))
+        
+        cursor.executemany('''
+            INSERT INTO process_events (computer_id, timestamp, event, pid, create_time,
+                                        name, cpu_percent, memory_percent)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
+        ''', process_events)
+        
+        cursor.executemany('''
+            INSERT OR REPLACE INTO process_state (computer_id, pid, create_time, name, cpu_percent, memory_percent)
+            VALUES (?, ?, ?, ?, ?, ?)
+        ''', [(row[0], row[3], row[4], row[5], row[6], row[7]) for row in process_events if row[2] not in ('leave', 'exit')])
+        
+        cursor.executemany('''
+            DELETE FROM process_state
+            WHERE computer_id = ? AND pid = ? AND create_time = ?
+        ''', [(row[0], row[3], row[4]) for row in process_events if row[2] in ('leave', 'exit')])
+        
+        cursor.executemany('''
+            UPDATE computers SET processes_at = ?
+            WHERE id = ?
+        ''', process_times)
+        
+        cursor.executemany('''
+            UPDATE computers SET last_seen = ?, status = 'online'
+            WHERE id = ?
+        ''', online_rows)
+        
+        cursor.executemany('''
+            UPDATE computers SET status = 'offline'
+            WHERE id = ?
+        ''', offline_ids)
+    
+    # Publish to the cache and live stream only once the batch is committed
+    updates = []
+    for sample in samples:
+        stats = stats_row_to_dict((None,) + sample['stats'])
+        processes = sorted((row[2:] for row in sample['processes']), key=lambda proc: proc[2], reverse=True)
+        latest_samples.update(
+            sample['computer_id'],
+            sample['stats'][1],
+            stats,
+            processes,
+            computer_names.get(sample['computer_id'], 'Unknown')
+        )
+        updates.append({
+            'id': sample['computer_id'],
+            'status': 'online',
+            'last_seen': str(sample['seen_at']),
+            'stats': stats
+        })
+    updates += [{'id': computer_id, 'status': 'offline'} for (computer_id,) in offline_ids]
+    
+    # One event per batch carries the changes for every computer in it
+    if updates and broadcaster.has_subscribers():
+        broadcaster.publish('samples', updates)
+
+def sample_writer():
+    """Background thread that flushes queued samples to the database in batches"""
+    conn = db.connect()
+    
+    while True:
+        batch = [sample_queue.get()]
+        
+        # Gather whatever else arrives within the flush window
+        deadline = time.monotonic() + WRITE_FLUSH_INTERVAL
+        while len(batch) < WRITE_BATCH_SIZE:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(sample_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        
+        try:
+            with write_batch_seconds.time():
+                write_batch(conn, batch)
+            written_samples.inc(sum(1 for item in batch if item['kind'] == 'sample'))
+        except Exception as e:
+            print(f"Error writing {len(batch)} samples: {e}")
+            write_errors.inc()
+            # The batch was rolled back, so reload process views, counters and series ids
+            process_tracker.forget()
+            sample_tracker.forget()
+            series_registry.forget()
+
+def get_rolled_until(conn, tier):
+    """Get the epoch time up to which a tier has been rolled up, or None"""
+    row = conn.execute('SELECT rolled_until FROM rollup_state WHERE tier = ?', (tier['name'],)).fetchone()
+    return row[0] if row else None
+
+def roll_up_tier(conn, tier, source, now):
+    """Summarise new rows of the source (raw stats when None) into a rollup tier"""
+    seconds = tier['seconds']
+    
+    if source is None:
+        source_table, time_column = 'stats', 'timestamp'
+        summaries = [f'{aggregate}({metric})' for metric in ROLLUP_METRICS for aggregate in ('MIN', 'MAX', 'AVG')]
+        summaries += [f'MAX({counter})' for counter in ROLLUP_COUNTERS]
+        sample_count = 'COUNT(*)'
+    else:
+        source_table, time_column = source['table'], 'bucket'
+        summaries = []
+        for metric in ROLLUP_METRICS:
+            summaries += [
+                f'MIN({metric}_min)',
+                f'MAX({metric}_max)',
+                f'SUM({metric}_avg * samples) / SUM(samples)'
+            ]
+        summaries += [f'MAX({counter}_max)' for counter in ROLLUP_COUNTERS]
+        sample_count = 'SUM(samples)'
+    
+    start = get_rolled_until(conn, tier)
+    if start is None:
+        first = conn.execute(f'SELECT MIN({time_column}) FROM {source_table}').fetchone()[0]
+        if first is None:
+            return
+        start = first - first % seconds
+    
+    end = min(now, start + ROLLUP_MAX_BUCKETS * seconds)
+    
+    # The newest buckets stay open and are recomputed until ROLLUP_LAG has passed,
+    # and a tier never closes buckets its source tier is still filling in
+    rolled_until = min(end, now - ROLLUP_LAG)
+    if source is not None:
+        rolled_until = min(rolled_until, get_rolled_until(conn, source) or start)
+    rolled_until = max(start, rolled_until - rolled_until % seconds)
+    
+    with conn:
+        conn.execute(f'''
+            INSERT OR REPLACE INTO {tier['table']} (computer_id, bucket, samples, {', '.join(rollup_column_names())})
+            SELECT computer_id, {time_column} - {time_column} % {seconds}, {sample_count}, {', '.join(summaries)}
+            FROM {source_table}
+            WHERE {time_column} >= ? AND {time_column} < ?
+            GROUP BY computer_id, {time_column} - {time_column} % {seconds}
+        ''', (start, end))
+        # Unless the sample writer moved the tier back meanwhile to take late samples
+        conn.execute('''
+            INSERT INTO rollup_state (tier, rolled_until)
+            VALUES (?, ?)
+            ON CONFLICT (tier) DO UPDATE SET rolled_until = excluded.rolled_until
+            WHERE rollup_state.rolled_until = ?
+        ''', (tier['name'], rolled_until, start))
+
+def prune_table(conn, table, time_column, cutoff):
+    """Delete rows older than cutoff in PRUNE_BATCH_SIZE transactions"""
+    deleted = 0
+    started = time.perf_counter()
+    
+    while True:
+        with conn:
+            cursor = conn.execute(f'''
+                DELETE FROM {table} WHERE id IN (
+                    SELECT id FROM {table}
+                    WHERE {time_column} < ?
+                    LIMIT ?
+                )
+            ''', (cutoff, PRUNE_BATCH_SIZE))
+        deleted += cursor.rowcount
+        if cursor.rowcount < PRUNE_BATCH_SIZE:
+            prune_seconds.observe(time.perf_counter() - started, table=table)
+            pruned_rows.inc(deleted, table=table)
+            return deleted
+
+def prune_metric_samples(conn, cutoff):
+    """Delete labelled series samples older than cutoff, PRUNE_SERIES_BATCH series per transaction"""
+    deleted = 0
+    started = time.perf_counter()
+    series_ids = [row[0] for row in conn.execute('SELECT id FROM metric_series')]
+    
+    # Each delete is a range scan of the (series_id, timestamp) key
+    for start in range(0, len(series_ids), PRUNE_SERIES_BATCH):
+        with conn:
+            cursor = conn.executemany('DELETE FROM metric_samples WHERE series_id = ? AND timestamp < ?',
+                                      [(series_id, cutoff) for series_id in series_ids[start:start + PRUNE_SERIES_BATCH]])
+        deleted += cursor.rowcount
+    
+    prune_seconds.observe(time.perf_counter() - started, table='metric_samples')
+    pruned_rows.inc(deleted, table='metric_samples')
+    
+    # The sample writer owns the series ids, so it deletes the series left empty
+    sample_queue.put({'kind': 'prune_series'})
+    return deleted
+
+def run_rollups(conn, now):
+    """Advance every rollup tier, then apply raw and rollup retention"""
+    source = None
+    for tier in ROLLUP_TIERS:
+        roll_up_tier(conn, tier, source, now)
+        source = tier
+    
+    # Data is only pruned once the next tier up has summarised it
+    rolled_until = get_rolled_until(conn, ROLLUP_TIERS[0]) or 0
+    prune_table(conn, 'stats', 'timestamp', min(now - RAW_RETENTION_DAYS * 86400, rolled_until))
+    
+    for tier, next_tier in zip(ROLLUP_TIERS, ROLLUP_TIERS[1:] + [None]):
+        if tier['retention_days'] is None:
+            continue
+        cutoff = now - tier['retention_days'] * 86400
+        if next_tier is not None:
+            cutoff = min(cutoff, get_rolled_until(conn, next_tier) or 0)
+        prune_table(conn, tier['table'], 'bucket', cutoff)
+
+def run_maintenance(conn):
+    """Prune old process events and series samples, and let the storage backend roll up and expire samples"""
+    now = int(time.time())
+    with maintenance_seconds.time():
+        prune_table(conn, 'process_events', 'timestamp', now - PROCESS_EVENT_RETENTION_DAYS * 86400)
+        prune_metric_samples(conn, now - METRIC_RETENTION_DAYS * 86400)
+        storage.maintain(conn, now)
+
+def rollup_worker():
+    """Background thread that maintains the rollup tables and retention"""
+    conn = db.connect()
+    
+    while True:
+        try:
+            run_maintenance(conn)
+        except Exception as e:
+            print(f"Error in rollup job: {e}")
+        
+        time.sleep(ROLLUP_INTERVAL)
+
+def select_tier(hours, points):
+    """Pick the finest resolution whose point count fits the budget (None means raw)"""
+    window = hours * 3600
+    
+    if window / RAW_SAMPLE_INTERVAL <= points and window <= RAW_RETENTION_DAYS * 86400:
+        return None
+    
+    for tier in ROLLUP_TIERS:
+        retention_days = tier['retention_days']
+        if window / tier['seconds'] <= points and (retention_days is None or window <= retention_days * 86400):
+            return tier
+    
+    return ROLLUP_TIERS[-1]
+
+def query_stats_series(cursor, computer_id, hours, tier, metrics, counters=(), extremes=False):
+    """Get (timestamp, *metrics, *counters) rows for a computer at the tier's resolution
+    
+    With extremes, every rollup bucket yields two rows instead of its average:
+    the minimum at the bucket start and the maximum half a bucket later.
+    """
+    since = int(time.time()) - hours * 3600
+    
+    if tier is None:
+        cursor.execute(f'''
+            SELECT timestamp, {', '.join(list(metrics) + list(counters))}
+            FROM stats
+            WHERE computer_id = ? AND timestamp > ?
+            ORDER BY timestamp
+        ''', (computer_id, since))
+    else:
+        selects = []
+        for offset, kind in ([(0, 'min'), (tier['seconds'] // 2, 'max')] if extremes else [(0, 'avg')]):
+            columns = [f'{metric}_{kind}' for metric in metrics] + [f'{counter}_max' for counter in counters]
+            selects.append(f'''
+                SELECT bucket + {offset} AS timestamp, {', '.join(columns)}
+                FROM {tier['table']}
+                WHERE computer_id = ? AND bucket >= ?
+            ''')
+        since_bucket = since - since % tier['seconds']
+        cursor.execute(' UNION ALL '.join(selects) + ' ORDER BY timestamp',
+                       (computer_id, since_bucket) * len(selects))
+    
+    return cursor.fetchall()
+
+def fetch_batches(cursor):
+    """Yield the rows of an executed query EXPORT_BATCH_SIZE at a time"""
+    while True:
+        rows = cursor.fetchmany(EXPORT_BATCH_SIZE)
+        if not rows:
+            return
+        yield rows
+
+def export_process_events(cursor, computer_ids, since, until):
+    """Yield batches of PROCESS_EVENT_COLUMNS rows, computer by computer"""
+    for computer_id in computer_ids:
         cursor.execute('''
-            INSERT INTO stats (computer_id, cpu_percent, memory_total, memory_used, 
+            SELECT computer_id, timestamp, event, pid, create_time, name, cpu_percent, memory_percent
+            FROM process_events
+            WHERE computer_id = ? AND timestamp >= ? AND timestamp < ?
+            ORDER BY timestamp
+        ''', (computer_id, since, until))
+        yield from fetch_batches(cursor)
+
+def export_columns(data, resolution):
+    """Column names of an export of stats ('raw' or a tier name) or process events"""
+    if data == 'processes':
+        return PROCESS_EVENT_COLUMNS
+    if resolution == 'raw':
+        return ['computer_id', 'timestamp'] + STATS_COLUMNS
+    return ['computer_id', 'timestamp', 'samples'] + rollup_column_names()
+
+class SQLiteStorage:
+    """Samples in the stats table, summarised into the rollup tables for long ranges"""
+    
+    def append(self, cursor, rows):
+        """Store (computer_id, timestamp, *STATS_COLUMNS) rows in the open transaction"""
+        cursor.executemany('''
+            INSERT INTO stats (computer_id, timestamp, cpu_percent, memory_total, memory_used, 
                              memory_percent, disk_total, disk_used, disk_percent,
                              network_bytes_sent, network_bytes_recv, 
                              network_sent_per_sec, network_recv_per_sec)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
-        ''', (
-            computer_id,
-            data['cpu_percent'],
-            data['memory']['total'],
-            data['memory']['used'],
-            data['memory']['percent'],
-            data['disk']['total'],
-            data['disk']['used'],
-            data['disk']['percent'] if 'percent' in data['disk'] else (data['disk']['used'] / data['disk']['total'] * 100),
-            data['network']['bytes_sent'],
-            data['network']['bytes_recv'],
-            network_sent_per_sec,
-            network_recv_per_sec
-        ))
-        
-        # Store process information if available
-        if 'top_processes' in data and data['top_processes']:
-            # Clear old processes for this computer (keep only last 1000 records)
-            cursor.execute('''
-                DELETE FROM processes 
-                WHERE computer_id = ? AND id NOT IN (
-                    SELECT id FROM processes 
-                    WHERE computer_id = ? 
-                    ORDER BY timestamp DESC 
-                    LIMIT 1000
-                )
-            ''', (computer_id, computer_id))
-            
-            # Insert new process data
-            for proc in data['top_processes']:
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        
+        # Backfilled and late samples reopen the rollup buckets they fall into, so the
+        # next rollup run summarises them again. Samples past raw retention are left
+        # out, since their buckets can no longer be rebuilt from complete raw data
+        cutoff = int(time.time()) - RAW_RETENTION_DAYS * 86400
+        timestamps = [row[1] for row in rows if row[1] >= cutoff]
+        if timestamps:
+            oldest = min(timestamps)
+            for tier in ROLLUP_TIERS:
+                bucket = oldest - oldest % tier['seconds']
                 cursor.execute('''
-                    INSERT INTO processes (computer_id, pid, name, cpu_percent, memory_percent, create_time)
-                    VALUES (?, ?, ?, ?, ?, ?)
-                ''', (
-                    computer_id,
-                    proc.get('pid', 0),
-                    proc.get('name', 'Unknown'),
-                    proc.get('cpu_percent', 0),
-                    proc.get('memory_percent', 0),
-                    proc.get('create_time', 0)
-                ))
-        
-        # Update computer status
+                    UPDATE rollup_state SET rolled_until = ?
+                    WHERE tier = ? AND rolled_until > ?
+                ''', (bucket, tier['name'], bucket))
+    
+    def latest(self, cursor, computer_id):
+        """Get the newest full stats row of a computer, or None"""
         cursor.execute('''
-            UPDATE computers SET last_seen = ?, status = 'online'
-            WHERE id = ?
-        ''', (datetime.now(), computer_id))
+            SELECT * FROM stats
+            WHERE computer_id = ?
+            ORDER BY timestamp DESC
+            LIMIT 1
+        ''', (computer_id,))
+        return cursor.fetchone()
+    
+    def latest_all(self, cursor):
+        """Get the newest full stats row of every computer by computer id"""
+        # One pass over computers; the latest sample is an index seek per computer
+        cursor.execute('''
+            SELECT s.*
+            FROM computers c
+            JOIN stats s ON s.id = (
+                SELECT id FROM stats
+                WHERE computer_id = c.id
+                ORDER BY timestamp DESC
+                LIMIT 1
+            )
+        ''')
+        return {row[1]: row for row in cursor.fetchall()}
+    
+    def series(self, cursor, computer_id, hours, points, metrics, counters=(), extremes=False):
+        """Get (resolution, rows) of (timestamp, *metrics, *counters) for a graph"""
+        tier = select_tier(hours, points)
+        rows = query_stats_series(cursor, computer_id, hours, tier, metrics, counters, extremes)
+        return (tier['name'] if tier else 'raw'), rows
+    
+    def host_summaries(self, cursor, metric, hours):
+        """Get (resolution, {computer_id: (samples, avg, min, max)}) of a gauge for every computer"""
+        tier = select_tier(hours, FLEET_ROWS_PER_HOST)
+        since = int(time.time()) - hours * 3600
         
-        conn.commit()
-        conn.close()
+        # One grouped scan over the time range instead of a query per computer
+        if tier is None:
+            cursor.execute(f'''
+                SELECT computer_id, COUNT({metric}), AVG({metric}), MIN({metric}), MAX({metric})
+                FROM stats
+                WHERE timestamp > ?
+                GROUP BY computer_id
+            ''', (since,))
+        else:
+            cursor.execute(f'''
+                SELECT computer_id, SUM(samples), SUM({metric}_avg * samples) / SUM(samples),
+                       MIN({metric}_min), MAX({metric}_max)
+                FROM {tier['table']}
+                WHERE bucket >= ?
+                GROUP BY computer_id
+            ''', (since - since % tier['seconds'],))
         
-        return True
+        summaries = {row[0]: row[1:] for row in cursor.fetchall() if row[1]}
+        return (tier['name'] if tier else 'raw'), summaries
+    
+    def export(self, cursor, computer_ids, since, until, resolution):
+        """Yield batches of export_columns('stats', resolution) rows, computer by computer"""
+        if resolution == 'raw':
+            table, time_column, columns = 'stats', 'timestamp', STATS_COLUMNS
+        else:
+            tier = next(tier for tier in ROLLUP_TIERS if tier['name'] == resolution)
+            table, time_column, columns = tier['table'], 'bucket', ['samples'] + rollup_column_names()
         
-    except Exception as e:
-        print(f"Error fetching stats from computer {computer_id}: {e}")
+        for computer_id in computer_ids:
+            cursor.execute(f'''
+                SELECT computer_id, {time_column}, {', '.join(columns)}
+                FROM {table}
+                WHERE computer_id = ? AND {time_column} >= ? AND {time_column} < ?
+                ORDER BY {time_column}
+            ''', (computer_id, since, until))
+            yield from fetch_batches(cursor)
+    
+    def maintain(self, conn, now):
+        """Advance the rollup tiers and apply retention"""
+        run_rollups(conn, now)
+    
+    def delete(self, cursor, computer_id):
+        """Delete every sample and rollup of a computer in the open transaction"""
+        cursor.execute('DELETE FROM stats WHERE computer_id = ?', (computer_id,))
+        for tier in ROLLUP_TIERS:
+            cursor.execute(f"DELETE FROM {tier['table']} WHERE computer_id = ?", (computer_id,))
+
+class ColumnarStorage:
+    """Samples in append-only per-day column files, aggregated on read
+    
+    Graph queries read only the columns they plot, so long ranges are served
+    from raw samples without the rollup tables, and retention drops whole
+    day partitions instead of deleting rows.
+    """
+    
+    def __init__(self, root):
+        self.store = columnar.ColumnarStore(root, STATS_COLUMNS)
+    
+    def append(self, cursor, rows):
+        """Store (computer_id, timestamp, *STATS_COLUMNS) rows"""
+        self.store.append(rows)
+    
+    def is_integer_column(self, column):
+        """Whether a stats column holds whole numbers (sizes and counters) in SQLite"""
+        return not column.endswith(('_percent', '_per_sec'))
+    
+    def latest(self, cursor, computer_id):
+        """Get the newest sample of a computer as a full stats row, or None"""
+        latest = self.store.latest(computer_id)
+        if latest is None:
+            return None
         
-        # Update computer status to offline
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        cursor.execute('''
-            UPDATE computers SET status = 'offline'
-            WHERE id = ?
-        ''', (computer_id,))
-        conn.commit()
-        conn.close()
+        timestamp, values = latest
+        values = [
+            int(value) if self.is_integer_column(column) else value
+            for column, value in zip(STATS_COLUMNS, values)
+        ]
+        return (None, computer_id, timestamp, *values)
+    
+    def latest_all(self, cursor):
+        """Get the newest sample of every computer as full stats rows by computer id"""
+        cursor.execute('SELECT id FROM computers')
+        latest = {}
+        for (computer_id,) in cursor.fetchall():
+            row = self.latest(cursor, computer_id)
+            if row is not None:
+                latest[computer_id] = row
+        return latest
+    
+    def series(self, cursor, computer_id, hours, points, metrics, counters=(), extremes=False):
+        """Get (resolution, rows) of (timestamp, *metrics, *counters) for a graph"""
+        window = hours * 3600
+        timestamps, values = self.store.scan(computer_id, int(time.time()) - window + 1, None,
+                                             list(metrics) + list(counters))
         
-        return False
+        if window / RAW_SAMPLE_INTERVAL <= points or not len(timestamps):
+            return 'raw', list(zip(timestamps.tolist(), *values.T.tolist()))
+        
+        # Same bucket sizes as the rollup tiers: averaged gauges, latest counters
+        tier = next((tier for tier in ROLLUP_TIERS if window / tier['seconds'] <= points), ROLLUP_TIERS[-1])
+        buckets, summary = columnar.summarize_buckets(timestamps, values, tier['seconds'], len(metrics),
+                                                      extremes)
+        return tier['name'], list(zip(buckets.tolist(), *summary.T.tolist()))
+    
+    def host_summaries(self, cursor, metric, hours):
+        """Get (resolution, {computer_id: (samples, avg, min, max)}) of a gauge for every computer"""
+        since = int(time.time()) - hours * 3600 + 1
+        cursor.execute('SELECT id FROM computers')
+        
+        summaries = {}
+        for (computer_id,) in cursor.fetchall():
+            _, values = self.store.scan(computer_id, since, None, [metric])
+            values = values[values == values]  # Drop NaN (missing) readings
+            if len(values):
+                summaries[computer_id] = (len(values), float(values.mean()), float(values.min()),
+                                          float(values.max()))
+        return 'raw', summaries
+    
+    def export(self, cursor, computer_ids, since, until, resolution):
+        """Yield batches of export_columns('stats', resolution) rows, one day partition at a time"""
+        seconds = next((tier['seconds'] for tier in ROLLUP_TIERS if tier['name'] == resolution), None)
+        columns = STATS_COLUMNS if seconds is None else ROLLUP_METRICS + ROLLUP_COUNTERS
+        
+        for computer_id in computer_ids:
+            for day in self.store.partitions():
+                day_start = self.store.day_start(day)
+                if day_start + 86400 <= since or day_start >= until:
+                    continue
+                
+                timestamps, values = self.store.scan(computer_id, max(since, day_start),
+                                                     min(until, day_start + 86400), columns)
+                if not len(timestamps):
+                    continue
+                
+                if seconds is None:
+                    values = [
+                        values[:, index].astype('int64') if self.is_integer_column(column) else values[:, index]
+                        for index, column in enumerate(columns)
+                    ]
+                    rows = list(zip([computer_id] * len(timestamps), timestamps.tolist(),
+                                    *[column.tolist() for column in values]))
+                else:
+                    buckets, counts, summary = columnar.rollup_buckets(timestamps, values, seconds,
+                                                                       len(ROLLUP_METRICS))
+                    rows = list(zip([computer_id] * len(buckets), buckets.tolist(), counts.tolist(),
+                                    *summary.T.tolist()))
+                
+                for start in range(0, len(rows), EXPORT_BATCH_SIZE):
+                    yield rows[start:start + EXPORT_BATCH_SIZE]
+    
+    def maintain(self, conn, now):
+        """Drop day partitions past COLUMNAR_RETENTION_DAYS"""
+        self.store.drop_before(now - COLUMNAR_RETENTION_DAYS * 86400)
+    
+    def delete(self, cursor, computer_id):
+        """Delete every sample of a computer"""
+        self.store.delete(computer_id)
+
+def create_storage():
+    """Create the storage backend named by STORAGE_BACKEND"""
+    if STORAGE_BACKEND == 'columnar':
+        if columnar is None:
+            raise RuntimeError("The columnar storage backend requires NumPy (pip install numpy)")
+        return ColumnarStorage(COLUMNAR_PATH)
+    return SQLiteStorage()
+
+# Backend used by the sample writer, the graph endpoints and retention
+storage = create_storage()
+
+def graph_series(cursor, computer_id, hours, points, metrics, counters=()):
+    """Get (resolution, rows) for a graph with at most points rows
+    
+    Reads a finer resolution than the budget (bucket extremes rather than
+    averages from rollups) and keeps the minimum and maximum of every
+    downsampling bucket, so spikes stay visible at any window length.
+    """
+    if downsample is None:
+        return storage.series(cursor, computer_id, hours, points, metrics, counters)
+    
+    resolution, rows = storage.series(cursor, computer_id, hours, points * DOWNSAMPLE_HEADROOM,
+                                      metrics, counters, extremes=True)
+    return resolution, downsample.min_max_rows(rows, points, len(metrics))
+
+def computer_counter_wrap(cursor, computer_id):
+    """Where a computer's counters wrap, from the counter_bits its client last reported"""
+    cursor.execute('SELECT counter_bits FROM computers WHERE id = ?', (computer_id,))
+    row = cursor.fetchone()
+    return counter_wrap(row[0] if row else None)
+
+def network_rate_series(cursor, computer_id, hours, points):
+    """Get (resolution, rows) of (timestamp, sent/s, recv/s, bytes sent, bytes received)
+    
+    Rates are computed at query time from the stored byte counters, over the
+    intervals between the rows read, so they follow the counters at every
+    resolution and survive resets, and wraps of counters marked 32-bit.
+    Without NumPy the stored per-second columns are used instead.
+    """
+    if rates is None:
+        return graph_series(cursor, computer_id, hours, points,
+                            ['network_sent_per_sec', 'network_recv_per_sec'], ROLLUP_COUNTERS)
+    
+    resolution, rows = storage.series(cursor, computer_id, hours, points * DOWNSAMPLE_HEADROOM,
+                                      [], ROLLUP_COUNTERS)
+    rows = rates.rate_rows(rows, computer_counter_wrap(cursor, computer_id), COUNTER_WRAP_ZONE)
+    return resolution, downsample.min_max_rows(rows, points, 2)
+
+class PollScheduler:
+    """When each computer is polled next, kept in a heap ordered by due time
+    
+    Every computer has its own interval. The next poll is planned one interval
+    after the previous plan rather than after the poll finished, so slow polls
+    do not push the schedule back, and drift records how late polls actually
+    started. Unreachable computers back off exponentially up to
+    POLL_BACKOFF_MAX, and every plan is shifted by up to POLL_JITTER of its
+    delay so computers added together do not stay in lockstep.
+    """
+    
+    def __init__(self):
+        self.heap = []  # (due, computer_id); stale entries are skipped when popped
+        self.hosts = {}
+        self.lock = threading.Lock()
+        self.drift = deque(maxlen=POLL_DRIFT_HISTORY)
+        self.polls = 0
+        self.failures = 0
+        self.wake = None  # Monotonic time the collector sleeps until
+    
+    def plan(self, computer_id, due):
+        """Set the next due time of a computer (call with the lock held)"""
+        self.hosts[computer_id]['due'] = due
+        heapq.heappush(self.heap, (due, computer_id))
+    
+    def sync(self, computers, now):
+        """Match the schedule to (computer_id, url, token, poll_interval) rows; returns removed ids"""
+        with self.lock:
+            for computer_id, url, token, interval in computers:
+                interval = interval or COLLECT_INTERVAL
+                host = self.hosts.get(computer_id)
+                
+                if host is None:
+                    # Spread new computers over their first interval
+                    self.hosts[computer_id] = {'url': url, 'token': token, 'interval': interval,
+                                               'failures': 0, 'in_flight': False}
+                    self.plan(computer_id, now + random.uniform(0, interval))
+                    continue
+                
+                # A shorter interval takes effect without waiting out the old one
+                if interval < host['interval'] and not host['in_flight'] and not host['failures']:
+                    self.plan(computer_id, min(host['due'], now + interval))
+                host.update(url=url, token=token, interval=interval)
+            
+            current = {computer[0] for computer in computers}
+            removed = [computer_id for computer_id in self.hosts if computer_id not in current]
+            for computer_id in removed:
+                del self.hosts[computer_id]
+            return removed
+    
+    def pop_due(self, now):
+        """Take the computers due by now as (computer_id, url, token) and mark them in flight"""
+        due = []
+        with self.lock:
+            while self.heap and self.heap[0][0] <= now:
+                planned, computer_id = heapq.heappop(self.heap)
+                host = self.hosts.get(computer_id)
+                if host is None or host['due'] != planned or host['in_flight']:
+                    continue
+                host['in_flight'] = True
+                due.append((computer_id, host['url'], host['token']))
+        return due
+    
+    def next_wake(self, limit):
+        """Monotonic time the collector should wake at: the earliest planned poll, at most limit"""
+        with self.lock:
+            self.wake = min(self.heap[0][0], limit) if self.heap else limit
+            return self.wake
+    
+    def started(self, computer_id, now):
+        """Record and return how far behind its plan a poll started (None if unknown)"""
+        with self.lock:
+            host = self.hosts.get(computer_id)
+            if host is None:
+                return None
+            self.drift.append(now - host['due'])
+            return now - host['due']
+    
+    def finished(self, computer_id, success, now):
+        """Plan the next poll after a success, a failure or a skip (success None)"""
+        with self.lock:
+            host = self.hosts.get(computer_id)
+            if host is None:
+                return
+            host['in_flight'] = False
+            
+            if success is not None:
+                self.polls += 1
+                if success:
+                    host['failures'] = 0
+                else:
+                    host['failures'] += 1
+                    self.failures += 1
+            
+            delay = min(host['interval'] * 2 ** host['failures'], max(POLL_BACKOFF_MAX, host['interval']))
+            delay *= 1 + random.uniform(-POLL_JITTER, POLL_JITTER)
+            
+            # Stay on the planned grid unless the poll overran its next slot
+            due = max(host['due'] + delay, now)
+            self.plan(computer_id, due)
+            
+            # Computers are out of the heap while in flight, so the collector may
+            # be asleep past this poll
+            if self.wake is not None and due < self.wake:
+                schedule_changed.set()
+    
+    def info(self, now):
+        """Schedule health for monitoring: backlog, backoff and start drift in seconds"""
+        with self.lock:
+            drift = sorted(self.drift)
+            return {
+                'hosts': len(self.hosts),
+                'in_flight': sum(1 for host in self.hosts.values() if host['in_flight']),
+                'backing_off': sum(1 for host in self.hosts.values() if host['failures']),
+                'overdue': sum(1 for host in self.hosts.values()
+                               if not host['in_flight'] and host['due'] < now - 1),
+                'polls': self.polls,
+                'failures': self.failures,
+                'drift_avg': round(sum(drift) / len(drift), 3) if drift else None,
+                'drift_p95': round(percentile(drift, 95), 3) if drift else None,
+                'drift_max': round(drift[-1], 3) if drift else None
+            }
+
+# Poll plan of every computer, driven by the collector thread
+poll_scheduler = PollScheduler()
+
+def poll_computer(computer_id, url, token):
+    """Poll one computer from a collector worker and plan its next poll"""
+    delay = poll_scheduler.started(computer_id, time.monotonic())
+    if delay is not None:
+        poll_delay_seconds.observe(max(0.0, delay))
+    success = False
+    try:
+        success = fetch_stats_from_computer(computer_id, url, token)
+        return success
+    finally:
+        poll_scheduler.finished(computer_id, success, time.monotonic())
 
 def stats_collector():
-    """Background thread to collect stats from all computers"""
+    """Background thread that polls each computer when the scheduler says it is due"""
+    executor = ThreadPoolExecutor(max_workers=POLL_CONCURRENCY, thread_name_prefix='poller')
+    next_sync = 0
+    
     while True:
+        now = time.monotonic()
         try:
-            conn = sqlite3.connect(DB_PATH)
-            cursor = conn.cursor()
-            
-            cursor.execute('SELECT id, url, token FROM computers')
-            computers = cursor.fetchall()
-            conn.close()
+            if now >= next_sync or schedule_changed.is_set():
+                schedule_changed.clear()
+                rows = db.query_all('SELECT id, name, url, token, poll_interval FROM computers')
+                computer_names.update({row[0]: row[1] for row in rows})
+                removed = poll_scheduler.sync([(computer_id, url, token, interval)
+                                               for computer_id, _, url, token, interval in rows], now)
+                
+                # Computers removed through another web worker leave state behind here
+                for computer_id in removed:
+                    drop_http_session(computer_id)
+                    poll_cursors.pop(computer_id, None)
+                    latest_samples.evict(computer_id)
+                next_sync = now + SCHEDULE_SYNC_INTERVAL
             
-            for computer_id, url, token in computers:
-                fetch_stats_from_computer(computer_id, url, token)
+            for computer_id, url, token in poll_scheduler.pop_due(now):
+                # Computers pushing their own samples are left alone until they go quiet
+                if now - push_last_seen.get(computer_id, float('-inf')) < PUSH_STALE_AFTER:
+                    poll_scheduler.finished(computer_id, None, now)
+                    poll_total.inc(outcome='skipped')
+                    continue
+                executor.submit(poll_computer, computer_id, url, token)
             
         except Exception as e:
             print(f"Error in stats collector: {e}")
         
-        time.sleep(30)  # Collect stats every 30 seconds
+        # Sleep until the next poll is due, the list is reloaded, computers change
+        # or a finished poll plans an earlier one
+        wake = poll_scheduler.next_wake(next_sync)
+        schedule_changed.wait(max(0.01, wake - time.monotonic()))
+
+def spool_reader():
+    """Background thread that moves pushes spooled by other processes to the sample writer"""
+    conn = db.connect()
+    
+    while True:
+        try:
+            rows = conn.execute('SELECT id, computer_id, boot_id, samples FROM ingest_spool ORDER BY id LIMIT 100').fetchall()
+            for _, computer_id, boot_id, samples in rows:
+                samples = json.loads(samples)
+                for data in samples:
+                    sample_queue.put(parse_sample(computer_id, data, boot_id))
+                
+                # The collector leaves pushing computers alone, as if they pushed here
+                push_last_seen[computer_id] = time.monotonic()
+                if samples and samples[-1].get('seq'):
+                    poll_cursors[computer_id] = (boot_id, samples[-1]['seq'])
+            
+            if rows:
+                with conn:
+                    conn.execute('DELETE FROM ingest_spool WHERE id <= ?', (rows[-1][0],))
+                continue
+        except Exception as e:
+            print(f"Error reading spooled pushes: {e}")
+        
+        time.sleep(WRITE_FLUSH_INTERVAL)
+
+def stream_relay():
+    """Background thread of processes that do not collect: republish new samples to their streams"""
+    seen = None
+    
+    while not collector_running.is_set():
+        time.sleep(STREAM_RELAY_INTERVAL)
+        if not broadcaster.has_subscribers():
+            seen = None
+            continue
+        
+        try:
+            with db.connection() as conn:
+                cursor = conn.cursor()
+                rows = cursor.execute('SELECT id, last_seen, status FROM computers').fetchall()
+                changed = [row for row in rows if seen is not None and seen.get(row[0]) != row[1:]]
+                latest = storage.latest_all(cursor) if changed else {}
+        except Exception as e:
+            print(f"Error relaying samples: {e}")
+            continue
+        
+        if seen is not None and set(seen) != {row[0] for row in rows}:
+            broadcaster.publish('computers', {})
+        
+        updates = []
+        for computer_id, last_seen, status in changed:
+            if status == 'online' and computer_id in latest:
+                updates.append({'id': computer_id, 'status': status, 'last_seen': last_seen,
+                                'stats': stats_row_to_dict(latest[computer_id])})
+            elif status != 'online':
+                updates.append({'id': computer_id, 'status': status})
+        if updates:
+            broadcaster.publish('samples', updates)
+        
+        seen = {row[0]: row[1:] for row in rows}
+
+def start_background_workers():
+    """Start the sample writer, rollup job, spool reader and collector in this process"""
+    collector_running.set()
+    for target in (sample_writer, rollup_worker, spool_reader, stats_collector):
+        threading.Thread(target=target, name=target.__name__, daemon=True).start()
+
+def run_for_collector(blocking):
+    """Become the single collector process once no other process holds the collector lock"""
+    lock = ProcessLock(db.DB_PATH + '.collector.lock')
+    while not lock.acquire(blocking=blocking):
+        time.sleep(LEADER_RETRY_INTERVAL)
+    
+    # Held until this process exits, when another one can take over
+    collector_locks.append(lock)
+    print(f"Process {os.getpid()} is running the collector")
+    start_background_workers()
+
+def start_role(role):
+    """Start the background work of a process in a given role
+    
+    'collector' waits for the collector lock and then polls, writes and rolls
+    up samples without serving requests; 'web' only serves requests; 'auto'
+    serves requests and takes the collector over whenever no other process
+    runs it, which elects one collector among multi-process web workers.
+    Processes that do not collect spool pushes for the collector and relay
+    its new samples to their live streams.
+    """
+    if role == 'collector':
+        run_for_collector(blocking=True)
+        return
+    
+    if role not in ('web', 'auto'):
+        raise ValueError(f"Unknown role {role!r}, expected 'auto', 'web' or 'collector'")
+    
+    threading.Thread(target=stream_relay, name='stream_relay', daemon=True).start()
+    if role == 'auto':
+        threading.Thread(target=run_for_collector, args=(False,), name='election', daemon=True).start()
+
+@app.before_request
+def start_request_timer():
+    """Note when a request started for the request latency histogram"""
+    g.request_started = time.perf_counter()
+
+@app.after_request
+def record_request_time(response):
+    """Observe request latency by route; streamed bodies are timed up to their first byte"""
+    started = g.get('request_started')
+    if started is not None:
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        request_seconds.observe(time.perf_counter() - started, route=route,
+                                method=request.method, status=response.status_code)
+    return response
 
 @app.route('/login', methods=['GET', 'POST'])
 def login():
@@ -269,9 +2174,11 @@ def login():
         username = request.form['username']
         password = request.form['password']
         
-        if authenticate_user(username, password):
+        user = authenticate_user(username, password)
+        if user is not None:
             session['logged_in'] = True
             session['username'] = username
+            session['user_id'], session['session_version'] = user
             flash('Login successful!', 'success')
             return redirect(url_for('dashboard'))
         else:
@@ -296,63 +2203,484 @@ def dashboard():
 @login_required
 def get_computers():
     """Get list of all computers"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT id, name, url, last_seen, status
+    rows = db.query_all('''
+        SELECT id, name, url, last_seen, status, poll_interval
         FROM computers
         ORDER BY name
     ''')
     
     computers = []
-    for row in cursor.fetchall():
+    for row in rows:
         computers.append({
             'id': row[0],
             'name': row[1],
             'url': row[2],
             'last_seen': row[3],
-            'status': row[4]
+            'status': row[4],
+            'poll_interval': row[5] or COLLECT_INTERVAL
         })
     
-    conn.close()
     return jsonify(computers)
 
+@app.route('/api/fleet')
+@login_required
+def get_fleet():
+    """Get all computers with their latest stats in one response"""
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('''
+            SELECT id, name, url, last_seen, status
+            FROM computers
+            ORDER BY name
+        ''')
+        rows = cursor.fetchall()
+        latest = storage.latest_all(cursor)
+    
+    fleet = []
+    for row in rows:
+        stats = latest.get(row[0])
+        fleet.append({
+            'id': row[0],
+            'name': row[1],
+            'url': row[2],
+            'last_seen': row[3],
+            'status': row[4],
+            'stats': stats_row_to_dict(stats) if stats is not None else None
+        })
+    
+    # Unchanged polls get a 304 via If-None-Match
+    response = jsonify(fleet)
+    response.headers['Cache-Control'] = 'no-cache'
+    response.add_etag()
+    return response.make_conditional(request)
+
+@app.route('/api/stream')
+@login_required
+def stream_updates():
+    """Push collector updates to the browser as Server-Sent Events"""
+    def generate():
+        subscriber = broadcaster.subscribe()
+        try:
+            # Ask the browser to reconnect after 5 seconds if the stream drops
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    yield subscriber.get(timeout=STREAM_KEEPALIVE)
+                except queue.Empty:
+                    yield ': keepalive\n\n'
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    return Response(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+
+def computer_for_token(token):
+    """Get (computer_id, name) of the computer a push token belongs to, or None"""
+    key = ('computer', auth.token_digest(token))
+    computer = auth_cache.get(key)
+    if computer is cache.MISS:
+        computer = db.query_one('SELECT id, name FROM computers WHERE token = ?', (token,))
+        auth_cache.put(key, computer)
+    return computer
+
+def read_push_body():
+    """Get the raw body of a push, inflating it if gzip-encoded
+    
+    Returns None if the body is too large, and raises ValueError if it is
+    not valid gzip.
+    """
+    try:
+        body = request.get_data()
+    except RequestEntityTooLarge:
+        return None
+    
+    if request.headers.get('Content-Encoding', '').lower() == 'gzip':
+        inflater = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            body = inflater.decompress(body, INGEST_MAX_BYTES)
+        except zlib.error as e:
+            raise ValueError(f'body is not valid gzip: {e}')
+        if inflater.unconsumed_tail:
+            return None
+        if not inflater.eof:
+            raise ValueError('gzip body is truncated')
+    
+    return body if len(body) <= INGEST_MAX_BYTES else None
+
+@app.route('/api/ingest', methods=['POST'])
+def ingest_samples():
+    """Accept snapshots pushed by a client, authenticated with its computer token"""
+    auth_header = request.headers.get('Authorization', '')
+    if not auth_header.startswith('Bearer '):
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    computer = computer_for_token(auth_header[len('Bearer '):])
+    
+    if not computer:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    computer_id, computer_name = computer
+    
+    # Ask the client to hold on to its samples while the writer catches up
+    if collector_running.is_set():
+        busy = sample_queue.qsize() >= WRITE_QUEUE_SIZE * INGEST_HIGH_WATER
+    else:
+        busy = db.query_one('SELECT COUNT(*) FROM ingest_spool')[0] >= INGEST_SPOOL_MAX
+    if busy:
+        response = jsonify({'error': 'Server busy', 'retry_after': PUSH_INTERVAL})
+        response.headers['Retry-After'] = str(PUSH_INTERVAL)
+        return response, 429
+    
+    try:
+        body = read_push_body()
+    except ValueError as e:
+        return jsonify({'error': f'Invalid payload: {e}'}), 400
+    if body is None:
+        return jsonify({'error': 'Payload too large'}), 413
+    
+    try:
+        payload = decode_payload(body, request.headers.get('Content-Type', ''))
+        if not isinstance(payload, dict):
+            raise ValueError('payload is not an object')
+        boot_id = payload.get('boot_id')
+        if boot_id is not None and not isinstance(boot_id, str):
+            raise ValueError('boot_id is not a string')
+        samples = payload['samples'][:INGEST_MAX_SAMPLES]
+        for data in samples:
+            check_sample(data)
+        parsed = [parse_sample(computer_id, data, boot_id) for data in samples]
+    except (ValueError, KeyError, TypeError) as e:
+        return jsonify({'error': f'Invalid payload: {e}'}), 400
+    
+    if not collector_running.is_set():
+        # Another process writes samples; hand the push over through the spool table
+        db.execute('INSERT INTO ingest_spool (computer_id, boot_id, samples) VALUES (?, ?, ?)',
+                   (computer_id, boot_id, json.dumps(samples)))
+        ingested_samples.inc(len(samples), source='push')
+        accepted_seq = samples[-1].get('seq', 0) if samples else None
+        return jsonify({'accepted': len(samples), 'accepted_seq': accepted_seq, 'interval': PUSH_INTERVAL})
+    
+    accepted = 0
+    for sample in parsed:
+        try:
+            sample_queue.put_nowait(sample)
+        except queue.Full:
+            break
+        accepted += 1
+    ingested_samples.inc(accepted, source='push')
+    
+    computer_names[computer_id] = computer_name
+    push_last_seen[computer_id] = time.monotonic()
+    
+    # Polling picks up from here if the client stops pushing
+    accepted_seq = samples[accepted - 1].get('seq', 0) if accepted else None
+    if accepted_seq:
+        poll_cursors[computer_id] = (boot_id, accepted_seq)
+    
+    return jsonify({
+        'accepted': accepted,
+        'accepted_seq': accepted_seq,
+        'interval': PUSH_INTERVAL
+    })
+
+def percentile(sorted_values, percent):
+    """Linearly interpolated percentile of an ascending list"""
+    position = (len(sorted_values) - 1) * percent / 100
+    lower = int(position)
+    upper = min(lower + 1, len(sorted_values) - 1)
+    return sorted_values[lower] + (sorted_values[upper] - sorted_values[lower]) * (position - lower)
+
+def get_host_summaries(metric, hours):
+    """Get (resolution, per-host summaries) of a gauge, cached for FLEET_CACHE_TTL"""
+    key = (metric, hours)
+    cached = fleet_cache.get(key)
+    if cached is cache.MISS:
+        with db.connection() as conn:
+            cached = storage.host_summaries(conn.cursor(), metric, hours)
+        fleet_cache.put(key, cached)
+    return cached
+
+def parse_fleet_args():
+    """Read metric, hours and by from the query string, or raise ValueError"""
+    metric = request.args.get('metric', 'cpu_percent')
+    hours = request.args.get('hours', 1, type=int)
+    by = request.args.get('by', 'avg')
+    
+    if metric not in ROLLUP_METRICS:
+        raise ValueError(f"metric must be one of {', '.join(ROLLUP_METRICS)}")
+    if hours < 1:
+        raise ValueError('hours must be at least 1')
+    if by not in ('avg', 'max'):
+        raise ValueError('by must be avg or max')
+    
+    return metric, hours, by
+
+@app.route('/api/fleet/summary')
+@login_required
+def get_fleet_summary():
+    """Aggregate a metric across all computers over the last hours"""
+    try:
+        metric, hours, by = parse_fleet_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    threshold = request.args.get('threshold', type=float)
+    
+    resolution, summaries = get_host_summaries(metric, hours)
+    
+    # Per-host values (window average or peak) feed the percentiles and threshold count
+    values = sorted(summary[1] if by == 'avg' else summary[3] for summary in summaries.values())
+    samples = sum(summary[0] for summary in summaries.values())
+    
+    result = {
+        'metric': metric,
+        'hours': hours,
+        'by': by,
+        'resolution': resolution,
+        'hosts': len(values),
+        'samples': samples,
+        'avg': sum(summary[0] * summary[1] for summary in summaries.values()) / samples if samples else None,
+        'min': min((summary[2] for summary in summaries.values()), default=None),
+        'max': max((summary[3] for summary in summaries.values()), default=None),
+        'percentiles': {f'p{percent}': percentile(values, percent) if values else None
+                        for percent in FLEET_PERCENTILES}
+    }
+    if threshold is not None:
+        result['threshold'] = threshold
+        result['above'] = sum(1 for value in values if value > threshold)
+    
+    return jsonify(result)
+
+@app.route('/api/fleet/top')
+@login_required
+def get_fleet_top():
+    """Get the k computers with the highest (or lowest) value of a metric"""
+    try:
+        metric, hours, by = parse_fleet_args()
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    k = min(max(1, request.args.get('k', 10, type=int)), FLEET_MAX_TOP)
+    lowest = request.args.get('order', 'desc') == 'asc'
+    
+    resolution, summaries = get_host_summaries(metric, hours)
+    
+    value_index = 1 if by == 'avg' else 3
+    select = heapq.nsmallest if lowest else heapq.nlargest
+    top = select(k, summaries.items(), key=lambda item: item[1][value_index])
+    
+    names = dict(db.query_all('SELECT id, name FROM computers'))
+    
+    return jsonify({
+        'metric': metric,
+        'hours': hours,
+        'by': by,
+        'resolution': resolution,
+        'hosts': [{
+            'id': computer_id,
+            'name': names.get(computer_id, 'Unknown'),
+            'value': summary[value_index],
+            'avg': summary[1],
+            'max': summary[3],
+            'samples': summary[0]
+        } for computer_id, summary in top]
+    })
+
+class ExportSink:
+    """Write-only file handed to pyarrow whose output is drained after every batch"""
+    
+    def __init__(self):
+        self.chunks = []
+        self.position = 0
+        self.closed = False
+    
+    def write(self, data):
+        """Buffer bytes until the next drain"""
+        self.chunks.append(bytes(data))
+        self.position += len(data)
+        return len(data)
+    
+    def tell(self):
+        """Bytes written so far, which Parquet uses for its footer offsets"""
+        return self.position
+    
+    def flush(self):
+        """Nothing to do; output is taken by drain()"""
+        pass
+    
+    def close(self):
+        """Mark the sink closed once pyarrow finishes writing"""
+        self.closed = True
+    
+    def drain(self):
+        """Take everything written since the last drain"""
+        data = b''.join(self.chunks)
+        self.chunks = []
+        return data
+
+def export_csv(columns, batches):
+    """Stream export batches as CSV with ISO 8601 timestamps"""
+    yield ','.join(columns) + '\n'
+    for batch in batches:
+        buffer = io.StringIO()
+        writer = csv.writer(buffer, lineterminator='\n')
+        writer.writerows((row[0], format_timestamp(row[1]), *row[2:]) for row in batch)
+        yield buffer.getvalue()
+
+def export_ndjson(columns, batches):
+    """Stream export batches as one JSON object per line"""
+    for batch in batches:
+        yield ''.join(
+            json.dumps(dict(zip(columns, (row[0], format_timestamp(row[1]), *row[2:])))) + '\n'
+            for row in batch
+        )
+
+def export_arrow(columns, batches, parquet):
+    """Stream export batches as a Parquet file or an Arrow IPC stream, one row group per batch"""
+    types = {'computer_id': pyarrow.int64(), 'pid': pyarrow.int64(), 'samples': pyarrow.int64(),
+             'event': pyarrow.string(), 'name': pyarrow.string(),
+             'timestamp': pyarrow.timestamp('s', tz='UTC')}
+    schema = pyarrow.schema([(column, types.get(column, pyarrow.float64())) for column in columns])
+    
+    sink = ExportSink()
+    if parquet:
+        writer = pyarrow.parquet.ParquetWriter(sink, schema)
+    else:
+        writer = pyarrow.ipc.new_stream(sink, schema)
+    
+    for batch in batches:
+        writer.write_table(pyarrow.Table.from_arrays([
+            pyarrow.array(values, type=field.type) for values, field in zip(zip(*batch), schema)
+        ], schema=schema))
+        yield sink.drain()
+    
+    writer.close()
+    yield sink.drain()
+
+def parse_time_arg(name, default):
+    """Read an epoch-seconds or ISO 8601 query parameter, or raise ValueError"""
+    value = request.args.get(name)
+    if value is None:
+        return default
+    
+    try:
+        return int(value)
+    except ValueError:
+        moment = datetime.fromisoformat(value.replace('Z', '+00:00'))
+        if moment.tzinfo is None:
+            moment = moment.replace(tzinfo=timezone.utc)
+        return int(moment.timestamp())
+
+@app.route('/api/export')
+@login_required
+def export_data():
+    """Stream stats or process events of some computers over a time range for offline analysis"""
+    data = request.args.get('data', 'stats')
+    export_format = request.args.get('format', 'csv')
+    resolution = request.args.get('resolution', 'raw')
+    
+    try:
+        until = parse_time_arg('end', int(time.time()))
+        since = parse_time_arg('start', until - request.args.get('hours', 24, type=int) * 3600)
+        computer_ids = [int(computer_id) for computer_id in request.args.get('computers', '').split(',') if computer_id]
+    except ValueError as e:
+        return jsonify({'error': f'Invalid parameter: {e}'}), 400
+    
+    if data not in ('stats', 'processes'):
+        return jsonify({'error': 'data must be stats or processes'}), 400
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if export_format in ('parquet', 'arrow') and pyarrow is None:
+        return jsonify({'error': f'{export_format} export requires pyarrow on the server'}), 400
+    if resolution != 'raw' and resolution not in [tier['name'] for tier in ROLLUP_TIERS]:
+        return jsonify({'error': 'resolution must be raw or a rollup tier name'}), 400
+    
+    if not computer_ids:
+        computer_ids = [row[0] for row in db.query_all('SELECT id FROM computers ORDER BY id')]
+    
+    columns = export_columns(data, resolution)
+    
+    def generate():
+        # The pooled connection is held until the last batch has been sent
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            if data == 'stats':
+                batches = storage.export(cursor, computer_ids, since, until, resolution)
+            else:
+                batches = export_process_events(cursor, computer_ids, since, until)
+            
+            if export_format == 'csv':
+                yield from export_csv(columns, batches)
+            elif export_format == 'ndjson':
+                yield from export_ndjson(columns, batches)
+            else:
+                yield from export_arrow(columns, batches, export_format == 'parquet')
+    
+    extension = {'ndjson': 'ndjson', 'parquet': 'parquet', 'arrow': 'arrows'}.get(export_format, 'csv')
+    return Response(generate(), mimetype=EXPORT_FORMATS[export_format], headers={
+        'Content-Disposition': f'attachment; filename="{data}-{since}-{until}.{extension}"',
+        'X-Accel-Buffering': 'no'
+    })
+
+@app.route('/api/collector/status')
+@login_required
+def get_collector_status():
+    """Get the health of the poll schedule, the caches and the connection pool"""
+    return jsonify({
+        # With several web workers, only the collector process has a live schedule
+        'process': {'pid': os.getpid(), 'collector': collector_running.is_set()},
+        'scheduler': poll_scheduler.info(time.monotonic()),
+        'cache': latest_samples.info(),
+        'fleet_cache': fleet_cache.info(),
+        'auth_cache': auth_cache.info(),
+        'db_pool': db.pool_info()
+    })
+
+@app.route('/metrics')
+def get_metrics():
+    """Server self-metrics in the Prometheus text format"""
+    # Scrapers authenticate with METRICS_TOKEN; a logged-in browser session also works
+    auth_header = request.headers.get('Authorization', '')
+    token_ok = METRICS_TOKEN is not None and hmac.compare_digest(auth_header, f'Bearer {METRICS_TOKEN}')
+    if not token_ok and session_user() is None:
+        return jsonify({'error': 'Unauthorized'}), 401
+    
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@app.route('/api/profiler', methods=['GET', 'POST'])
+@login_required
+def profiler_endpoint():
+    """Start or stop the sampling profiler (POST), or get its report (GET)"""
+    if request.method == 'POST':
+        data = request.get_json(silent=True) or {}
+        interval = data.get('interval')
+        if interval is not None and (not isinstance(interval, (int, float)) or not 0.001 <= interval <= 1):
+            return jsonify({'error': 'interval must be between 0.001 and 1 seconds'}), 400
+        
+        if data.get('enabled'):
+            profiler.start(interval)
+        else:
+            profiler.stop()
+    
+    # Collapsed stacks load straight into flame graph tools such as speedscope
+    if request.args.get('format') == 'collapsed':
+        return Response(profiler.collapsed(), mimetype='text/plain')
+    
+    return jsonify(profiler.report(PROFILE_TOP))
+
 @app.route('/api/stats/<int:computer_id>')
 @login_required
 def get_computer_stats(computer_id):
     """Get latest stats for a specific computer"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cached = latest_samples.get(computer_id)
+    if cached is not None:
+        return jsonify(cached['stats'])
     
     # Get latest stats
-    cursor.execute('''
-        SELECT * FROM stats
-        WHERE computer_id = ?
-        ORDER BY timestamp DESC
-        LIMIT 1
-    ''', (computer_id,))
-    
-    row = cursor.fetchone()
-    if row:
-        stats = {
-            'timestamp': row[2],
-            'cpu_percent': row[3],
-            'memory_total': row[4],
-            'memory_used': row[5],
-            'memory_percent': row[6],
-            'disk_total': row[7],
-            'disk_used': row[8],
-            'disk_percent': row[9],
-            'network_bytes_sent': row[10],
-            'network_bytes_recv': row[11],
-            'network_sent_per_sec': row[12] if len(row) > 12 else 0,
-            'network_recv_per_sec': row[13] if len(row) > 13 else 0
-        }
-    else:
-        stats = None
+    with db.connection() as conn:
+        row = storage.latest(conn.cursor(), computer_id)
     
-    conn.close()
+    stats = stats_row_to_dict(row) if row else None
     return jsonify(stats)
 
 @app.route('/api/history/<int:computer_id>')
@@ -360,49 +2688,37 @@ def get_computer_stats(computer_id):
 def get_computer_history(computer_id):
     """Get historical stats for a computer"""
     hours = request.args.get('hours', 24, type=int)
+    points = min(max(1, request.args.get('points', DEFAULT_GRAPH_POINTS, type=int)), MAX_GRAPH_POINTS)
     
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    cursor.execute('''
-        SELECT timestamp, cpu_percent, memory_percent, disk_percent
-        FROM stats
-        WHERE computer_id = ? AND timestamp > datetime('now', '-{} hours')
-        ORDER BY timestamp
-    '''.format(hours), (computer_id,))
+    with db.connection() as conn:
+        _, rows = graph_series(conn.cursor(), computer_id, hours, points,
+                               ['cpu_percent', 'memory_percent', 'disk_percent'])
     
     history = []
-    for row in cursor.fetchall():
+    for row in rows:
         history.append({
-            'timestamp': row[0],
+            'timestamp': format_timestamp(row[0]),
             'cpu_percent': row[1],
             'memory_percent': row[2],
             'disk_percent': row[3]
         })
     
-    conn.close()
     return jsonify(history)
 
 @app.route('/api/network_graph/<int:computer_id>')
 @login_required
 def get_network_graph_data(computer_id):
-    """Get 24-hour network usage data for graphing"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    """Get network usage data for graphing (last 24 hours by default)"""
+    hours = request.args.get('hours', 24, type=int)
+    points = min(max(1, request.args.get('points', DEFAULT_GRAPH_POINTS, type=int)), MAX_GRAPH_POINTS)
     
-    # Get network usage data for the last 24 hours
-    cursor.execute('''
-        SELECT timestamp, network_sent_per_sec, network_recv_per_sec,
-               network_bytes_sent, network_bytes_recv
-        FROM stats
-        WHERE computer_id = ? AND timestamp > datetime('now', '-24 hours')
-        ORDER BY timestamp
-    ''', (computer_id,))
+    with db.connection() as conn:
+        resolution, rows = network_rate_series(conn.cursor(), computer_id, hours, points)
     
     network_data = []
-    for row in cursor.fetchall():
+    for row in rows:
         network_data.append({
-            'timestamp': row[0],
+            'timestamp': format_timestamp(row[0]),
             'sent_per_sec': row[1] or 0,
             'recv_per_sec': row[2] or 0,
             'total_sent': row[3] or 0,
@@ -410,93 +2726,179 @@ def get_network_graph_data(computer_id):
         })
     
     # Get computer name for the graph title
-    cursor.execute('SELECT name FROM computers WHERE id = ?', (computer_id,))
-    computer_name = cursor.fetchone()
-    computer_name = computer_name[0] if computer_name else 'Unknown'
-    
-    conn.close()
+    computer_name = get_computer_name(computer_id)
     
     return jsonify({
         'computer_name': computer_name,
+        'resolution': resolution,
         'data': network_data
     })
 
 @app.route('/api/cpu_graph/<int:computer_id>')
 @login_required
 def get_cpu_graph_data(computer_id):
-    """Get 24-hour CPU usage data for graphing"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    """Get CPU usage data for graphing (last 24 hours by default)"""
+    hours = request.args.get('hours', 24, type=int)
+    points = min(max(1, request.args.get('points', DEFAULT_GRAPH_POINTS, type=int)), MAX_GRAPH_POINTS)
     
-    # Get CPU usage data for the last 24 hours
-    cursor.execute('''
-        SELECT timestamp, cpu_percent
-        FROM stats
-        WHERE computer_id = ? AND timestamp > datetime('now', '-24 hours')
-        ORDER BY timestamp
-    ''', (computer_id,))
+    with db.connection() as conn:
+        resolution, rows = graph_series(conn.cursor(), computer_id, hours, points, ['cpu_percent'])
     
     cpu_data = []
-    for row in cursor.fetchall():
+    for row in rows:
         cpu_data.append({
-            'timestamp': row[0],
+            'timestamp': format_timestamp(row[0]),
             'cpu_percent': row[1] or 0
         })
     
     # Get computer name for the graph title
-    cursor.execute('SELECT name FROM computers WHERE id = ?', (computer_id,))
-    computer_name = cursor.fetchone()
-    computer_name = computer_name[0] if computer_name else 'Unknown'
-    
-    conn.close()
+    computer_name = get_computer_name(computer_id)
     
     return jsonify({
         'computer_name': computer_name,
+        'resolution': resolution,
         'data': cpu_data
     })
 
+def metric_series_rows(cursor, series_id, counter, hours, points, wrap=None):
+    """Get (timestamp, value) rows of a labelled series for a graph with at most points rows
+    
+    Counters are turned into per-second rates between consecutive samples,
+    allowing for wraps at wrap if given.
+    """
+    cursor.execute('''
+        SELECT timestamp, value FROM metric_samples
+        WHERE series_id = ? AND timestamp > ?
+        ORDER BY timestamp
+    ''', (series_id, int(time.time()) - hours * 3600))
+    rows = cursor.fetchall()
+    
+    if counter and rates is not None:
+        rows = [row[:2] for row in rates.rate_rows(rows, wrap, COUNTER_WRAP_ZONE)]
+    elif counter:
+        rows = [(current[0], counter_increase(previous[1], current[1], wrap) / (current[0] - previous[0]))
+                for previous, current in zip(rows, rows[1:]) if current[0] > previous[0]]
+    
+    if downsample is not None:
+        return downsample.min_max_rows(rows, points, 1)
+    return rows[::-(-len(rows) // points) or 1]
+
+@app.route('/api/series/<int:computer_id>')
+@login_required
+def list_metric_series(computer_id):
+    """List the labelled series a computer reports, with their descriptors"""
+    rows = db.query_all('''
+        SELECT s.name, s.labels, d.type, d.unit, d.description
+        FROM metric_series s
+        JOIN metric_descriptors d ON d.name = s.name
+        WHERE s.computer_id = ?
+        ORDER BY s.name, s.labels
+    ''', (computer_id,))
+    
+    return jsonify([{
+        'name': name,
+        'labels': json.loads(labels),
+        'type': metric_type,
+        'unit': unit,
+        'description': description
+    } for name, labels, metric_type, unit, description in rows])
+
+@app.route('/api/series/<int:computer_id>/<name>')
+@login_required
+def get_metric_series(computer_id, name):
+    """Get every series of a metric for graphing (last 24 hours by default)
+    
+    Query parameters other than hours and points filter on labels, e.g.
+    /api/series/1/net.bytes_recv?nic=eth0. Counters are returned as rates.
+    """
+    hours = request.args.get('hours', 24, type=int)
+    points = min(max(1, request.args.get('points', DEFAULT_GRAPH_POINTS, type=int)), MAX_GRAPH_POINTS)
+    filters = {key: value for key, value in request.args.items() if key not in ('hours', 'points')}
+    
+    with db.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute('SELECT type, unit, description FROM metric_descriptors WHERE name = ?', (name,))
+        descriptor = cursor.fetchone()
+        if descriptor is None:
+            return jsonify({'error': 'Unknown metric'}), 404
+        
+        metric_type, unit, description = descriptor
+        counter = metric_type == 'counter'
+        wrap = computer_counter_wrap(cursor, computer_id)
+        
+        cursor.execute('''
+            SELECT id, labels FROM metric_series
+            WHERE computer_id = ? AND name = ?
+            ORDER BY labels
+        ''', (computer_id, name))
+        
+        series = []
+        for series_id, labels in cursor.fetchall():
+            labels = json.loads(labels)
+            if any(labels.get(key) != value for key, value in filters.items()):
+                continue
+            
+            rows = metric_series_rows(cursor, series_id, counter, hours, points, wrap)
+            series.append({
+                'labels': labels,
+                'data': [{'timestamp': format_timestamp(row[0]), 'value': row[1]} for row in rows]
+            })
+    
+    return jsonify({
+        'computer_name': get_computer_name(computer_id),
+        'name': name,
+        'type': metric_type,
+        'unit': f'{unit}/s' if counter and unit else unit,
+        'description': description,
+        'series': series
+    })
+
 @app.route('/api/processes/<int:computer_id>')
 @login_required
 def get_computer_processes(computer_id):
     """Get current top processes for a computer"""
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    cached = latest_samples.get(computer_id)
+    if cached is not None:
+        fresh = cached['timestamp'] > int(time.time()) - PROCESS_MAX_AGE
+        return jsonify({
+            'computer_name': cached['computer_name'],
+            'processes': [process_row_to_dict(row) for row in cached['processes'][:20]] if fresh else []
+        })
     
-    # Get the latest processes for this computer
-    cursor.execute('''
-        SELECT pid, name, cpu_percent, memory_percent, create_time
-        FROM processes
-        WHERE computer_id = ? AND timestamp > datetime('now', '-5 minutes')
-        ORDER BY timestamp DESC, cpu_percent DESC
+    # Get the current process view for this computer, if it was reported recently
+    rows = db.query_all('''
+        SELECT p.pid, p.name, p.cpu_percent, p.memory_percent, p.create_time
+        FROM process_state p
+        JOIN computers c ON c.id = p.computer_id
+        WHERE p.computer_id = ? AND c.processes_at > ?
+        ORDER BY p.cpu_percent DESC
         LIMIT 20
-    ''', (computer_id,))
+    ''', (computer_id, int(time.time()) - PROCESS_MAX_AGE))
     
-    processes = []
-    for row in cursor.fetchall():
-        # Calculate uptime from create_time
-        uptime_seconds = time.time() - row[4] if row[4] else 0
-        uptime_hours = uptime_seconds / 3600
-        
-        processes.append({
-            'pid': row[0],
-            'name': row[1],
-            'cpu_percent': round(row[2], 1),
-            'memory_percent': round(row[3], 2),
-            'uptime_hours': round(uptime_hours, 1)
-        })
+    processes = [process_row_to_dict(row) for row in rows]
     
     # Get computer name
-    cursor.execute('SELECT name FROM computers WHERE id = ?', (computer_id,))
-    computer_name = cursor.fetchone()
-    computer_name = computer_name[0] if computer_name else 'Unknown'
-    
-    conn.close()
+    computer_name = get_computer_name(computer_id)
     
     return jsonify({
         'computer_name': computer_name,
         'processes': processes
     })
 
+def parse_poll_interval(value):
+    """Validate an optional poll interval in seconds (None means COLLECT_INTERVAL)"""
+    if value in (None, ''):
+        return None
+    
+    try:
+        interval = int(value)
+    except (TypeError, ValueError):
+        raise ValueError('poll_interval must be a whole number of seconds')
+    
+    if not POLL_MIN_INTERVAL <= interval <= POLL_MAX_INTERVAL:
+        raise ValueError(f'poll_interval must be between {POLL_MIN_INTERVAL} and {POLL_MAX_INTERVAL} seconds')
+    return interval
+
 @app.route('/api/add_computer', methods=['POST'])
 @login_required
 def add_computer_endpoint():
@@ -509,39 +2911,77 @@ def add_computer_endpoint():
     if not all([name, url, token]):
         return jsonify({'error': 'Missing required fields'}), 400
     
-    success = add_computer(name, url, token)
+    try:
+        poll_interval = parse_poll_interval(data.get('poll_interval'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    success = add_computer(name, url, token, poll_interval)
     if success:
+        auth_cache.clear()  # The token may have been cached as unknown
+        schedule_changed.set()
+        broadcaster.publish('computers', {})
         return jsonify({'message': 'Computer added successfully'})
     else:
         return jsonify({'error': 'Failed to add computer'}), 500
 
+@app.route('/api/poll_interval/<int:computer_id>', methods=['POST'])
+@login_required
+def set_poll_interval_endpoint(computer_id):
+    """Change how often a computer is polled (null restores the default)"""
+    try:
+        poll_interval = parse_poll_interval((request.json or {}).get('poll_interval'))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if not db.execute('UPDATE computers SET poll_interval = ? WHERE id = ?', (poll_interval, computer_id)):
+        return jsonify({'error': 'Computer not found'}), 404
+    
+    schedule_changed.set()
+    broadcaster.publish('computers', {})
+    return jsonify({'message': 'Poll interval updated', 'poll_interval': poll_interval or COLLECT_INTERVAL})
+
 @app.route('/api/remove_computer/<int:computer_id>', methods=['DELETE'])
 @login_required
 def remove_computer_endpoint(computer_id):
     """Remove a computer from monitoring"""
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Check if computer exists
-        cursor.execute('SELECT name FROM computers WHERE id = ?', (computer_id,))
-        computer = cursor.fetchone()
-        
-        if not computer:
-            conn.close()
-            return jsonify({'error': 'Computer not found'}), 404
-        
-        computer_name = computer[0]
-        
-        # Delete related stats and processes first (foreign key constraint)
-        cursor.execute('DELETE FROM stats WHERE computer_id = ?', (computer_id,))
-        cursor.execute('DELETE FROM processes WHERE computer_id = ?', (computer_id,))
-        
-        # Delete the computer
-        cursor.execute('DELETE FROM computers WHERE id = ?', (computer_id,))
+        with db.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Check if computer exists
+            cursor.execute('SELECT name FROM computers WHERE id = ?', (computer_id,))
+            computer = cursor.fetchone()
+            
+            if not computer:
+                return jsonify({'error': 'Computer not found'}), 404
+            
+            computer_name = computer[0]
+            
+            # Delete related stats and processes first (foreign key constraint)
+            storage.delete(cursor, computer_id)
+            cursor.execute('DELETE FROM process_events WHERE computer_id = ?', (computer_id,))
+            cursor.execute('DELETE FROM process_state WHERE computer_id = ?', (computer_id,))
+            cursor.execute('''
+                DELETE FROM metric_samples
+                WHERE series_id IN (SELECT id FROM metric_series WHERE computer_id = ?)
+            ''', (computer_id,))
+            cursor.execute('DELETE FROM metric_series WHERE computer_id = ?', (computer_id,))
+            
+            # Delete the computer
+            cursor.execute('DELETE FROM computers WHERE id = ?', (computer_id,))
         
-        conn.commit()
-        conn.close()
+        drop_http_session(computer_id)
+        poll_cursors.pop(computer_id, None)
+        push_last_seen.pop(computer_id, None)
+        latest_samples.evict(computer_id)
+        process_tracker.forget(computer_id)
+        sample_tracker.forget(computer_id)
+        series_registry.forget(computer_id)
+        poll_seconds.remove(computer_id=computer_id)
+        auth_cache.clear()
+        schedule_changed.set()
+        broadcaster.publish('computers', {})
         
         return jsonify({'message': f'Computer "{computer_name}" removed successfully'})
         
@@ -549,6 +2989,37 @@ def remove_computer_endpoint(computer_id):
         print(f"Error removing computer {computer_id}: {e}")
         return jsonify({'error': 'Failed to remove computer'}), 500
 
+@app.route('/api/tokens', methods=['GET', 'POST'])
+@session_required
+def api_tokens_endpoint():
+    """List the current user's API tokens, or create one (its value is only returned now)"""
+    user_id = session_user()
+    
+    if request.method == 'POST':
+        name = ((request.get_json(silent=True) or {}).get('name') or '').strip()
+        if not name:
+            return jsonify({'error': 'Missing token name'}), 400
+        
+        token = auth.generate_token()
+        with db.connection() as conn:
+            cursor = conn.execute('INSERT INTO api_tokens (user_id, name, token_hash) VALUES (?, ?, ?)',
+                                  (user_id, name, auth.token_digest(token)))
+        auth_cache.clear()  # The token may have been cached as unknown
+        return jsonify({'id': cursor.lastrowid, 'name': name, 'token': token})
+    
+    rows = db.query_all('SELECT id, name, created_at FROM api_tokens WHERE user_id = ? ORDER BY id', (user_id,))
+    return jsonify([{'id': row[0], 'name': row[1], 'created_at': row[2]} for row in rows])
+
+@app.route('/api/tokens/<int:token_id>', methods=['DELETE'])
+@session_required
+def revoke_api_token_endpoint(token_id):
+    """Revoke one of the current user's API tokens"""
+    if not db.execute('DELETE FROM api_tokens WHERE id = ? AND user_id = ?', (token_id, session_user())):
+        return jsonify({'error': 'Token not found'}), 404
+    
+    auth_cache.clear()
+    return jsonify({'message': 'Token revoked'})
+
 @app.route('/change_password', methods=['GET', 'POST'])
 @login_required
 def change_password():
@@ -562,22 +3033,18 @@ def change_password():
             flash('New passwords do not match!', 'error')
             return render_template('change_password.html')
         
-        if not authenticate_user(session['username'], current_password):
+        if authenticate_user(session['username'], current_password) is None:
             flash('Current password is incorrect!', 'error')
             return render_template('change_password.html')
         
-        # Update password
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        new_password_hash = hashlib.sha256(new_password.encode()).hexdigest()
-        cursor.execute('''
-            UPDATE users SET password_hash = ?
-            WHERE username = ?
-        ''', (new_password_hash, session['username']))
-        
-        conn.commit()
-        conn.close()
+        # Update password and sign out every other session of this user
+        new_password_hash = auth.hash_password(new_password)
+        db.execute('''
+            UPDATE users SET password_hash = ?, session_version = session_version + 1
+            WHERE id = ?
+        ''', (new_password_hash, session['user_id']))
+        session['session_version'] += 1
+        auth_cache.clear()
         
         flash('Password changed successfully!', 'success')
         return redirect(url_for('dashboard'))
@@ -591,10 +3058,10 @@ def manage_computers():
     return render_template('manage.html')
 
 if __name__ == '__main__':
-    init_db()
-    
-    # Start stats collector in background thread
-    collector_thread = threading.Thread(target=stats_collector, daemon=True)
-    collector_thread.start()
+    # Development server; see wsgi.py for production serving
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        # Only the reloader's child serves requests, so only it collects
+        init_db()
+        start_background_workers()
     
     app.run(host='0.0.0.0', port=8001, debug=True)
@@ -1,6 +1,11 @@
 @echo off
 REM System Statistics Server Startup Script (Windows)
 REM This script starts the Flask dashboard server
+REM Usage: start_server.bat [--production]
+REM   --production  serve with waitress (wsgi.py) instead of the development server
+
+set MODE=development
+if "%~1"=="--production" set MODE=production
 
 echo === System Statistics Server Startup ===
 echo Starting Flask Dashboard Server...
@@ -54,7 +59,7 @@ echo.
 echo ==================================
 echo   SYSTEM STATISTICS SERVER
 echo ==================================
-echo Server will start on: http://localhost:8001
+echo Server will start on: http://localhost:8001 (%MODE% mode)
 echo Default login:
 echo   Username: admin
 echo   Password: admin123
@@ -65,6 +70,10 @@ echo.
 
 REM Start the server
 echo Starting server...
-python server.py
+if "%MODE%"=="production" (
+    python wsgi.py
+) else (
+    python server.py
+)
 
 pause
\ No newline at end of file
@@ -2,6 +2,29 @@
 
 # System Statistics Server Startup Script (Linux/macOS)
 # This script starts the Flask dashboard server
+#
+# Usage: ./start_server.sh [--production [--workers N]]
+#   --production  serve with gunicorn (gunicorn.conf.py, wsgi.py) instead of the
+#                 development server; one worker is elected to run the collector
+#   --workers N   number of gunicorn worker processes (default 4)
+
+MODE="development"
+while [ $# -gt 0 ]; do
+    case "$1" in
+        --production)
+            MODE="production"
+            ;;
+        --workers)
+            export MONITOR_WORKERS="$2"
+            shift
+            ;;
+        *)
+            echo "Usage: $0 [--production [--workers N]]"
+            exit 1
+            ;;
+    esac
+    shift
+done
 
 echo "=== System Statistics Server Startup ==="
 echo "Starting Flask Dashboard Server..."
@@ -34,7 +57,7 @@ echo "Activating virtual environment..."
 source venv/bin/activate
 
 # Check if requirements are installed
-if [ ! -f "venv/requirements_installed.flag" ]; then
+if [ ! -f "venv/requirements_installed.flag" ] || { [ "$MODE" = "production" ] && ! command -v gunicorn &> /dev/null; }; then
     echo "Installing requirements..."
     pip install -r requirements.txt
     if [ $? -eq 0 ]; then
@@ -53,7 +76,7 @@ echo ""
 echo "=================================="
 echo "  SYSTEM STATISTICS SERVER"
 echo "=================================="
-echo "Server will start on: http://localhost:8001"
+echo "Server will start on: http://localhost:8001 ($MODE mode)"
 echo "Default login:"
 echo "  Username: admin"
 echo "  Password: admin123"
@@ -64,4 +87,8 @@ echo ""
 
 # Start the server
 echo "Starting server..."
-python server.py
\ No newline at end of file
+if [ "$MODE" = "production" ]; then
+    exec gunicorn -c gunicorn.conf.py wsgi:app
+else
+    python server.py
+fi
\ No newline at end of file
@@ -0,0 +1,73 @@
+"""Production entry point of the dashboard server.
+
+Serve it with a multi-worker WSGI server; every worker imports this module:
+
+    gunicorn -c gunicorn.conf.py wsgi:app      (Linux/macOS)
+    python wsgi.py                             (waitress, any platform)
+
+MONITOR_ROLE picks what a process does besides serving requests:
+
+    auto       (default) workers elect one of themselves to poll computers,
+               write samples and run rollups; if it exits another takes over
+    web        only serve requests, e.g. next to a separate collector process
+    collector  no web server: python wsgi.py --role collector
+
+Pushes received by a worker that is not the collector are handed over
+through the ingest_spool table, and its live streams relay the samples the
+collector writes. DATABASE_PATH overrides the database file.
+"""
+import argparse
+import os
+import threading
+
+try:
+    import waitress
+except ImportError:  # Only needed by python wsgi.py; gunicorn imports app directly
+    waitress = None
+
+import db
+import server
+from process_lock import ProcessLock
+
+ROLE = os.environ.get('MONITOR_ROLE', 'auto')
+HOST = os.environ.get('MONITOR_HOST', '0.0.0.0')
+PORT = int(os.environ.get('MONITOR_PORT', 8001))
+THREADS = int(os.environ.get('MONITOR_THREADS', 16))  # waitress request threads
+
+app = server.app
+
+def setup(role):
+    """Prepare the database and start the background work of this process"""
+    if os.environ.get('DATABASE_PATH'):
+        db.configure(os.environ['DATABASE_PATH'])
+    
+    # Workers start together, and the schema must only be migrated once
+    with ProcessLock(db.DB_PATH + '.init.lock'):
+        server.init_db()
+    
+    server.start_role(role)
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the dashboard server with waitress, or the collector alone')
+    parser.add_argument('--role', default=ROLE, choices=['auto', 'web', 'collector'],
+                        help='background work of this process (default: MONITOR_ROLE or auto)')
+    parser.add_argument('--host', default=HOST, help='address to listen on')
+    parser.add_argument('--port', type=int, default=PORT, help='port to listen on')
+    parser.add_argument('--threads', type=int, default=THREADS, help='request threads')
+    args = parser.parse_args()
+    
+    setup(args.role)
+    
+    if args.role == 'collector':
+        threading.Event().wait()
+    
+    if waitress is None:
+        raise SystemExit("waitress is not installed (pip install waitress), or serve wsgi:app with gunicorn")
+    
+    # Live streams hold a thread each, so leave room for them
+    waitress.serve(app, host=args.host, port=args.port, threads=args.threads)
+
+if __name__ == '__main__':
+    main()
+else:
+    setup(ROLE)